@@ -0,0 +1,66 @@
+# Copyright (c) 2025, NTS and contributors
+# For license information, please see license.txt
+
+import json
+
+import click
+import nts
+from nts.commands import get_site, pass_context
+
+
+@click.command("reporting-load-test")
+@click.option("--terminals", default=8, show_default=True, help="Concurrent simulated terminals")
+@click.option("--punches", default=50, show_default=True, help="Requests issued by each terminal")
+@click.option(
+	"--hotspot",
+	default=0.2,
+	show_default=True,
+	type=click.FloatRange(0, 1),
+	help="Share of requests aimed at the same work order operation",
+)
+@click.option(
+	"--read-ratio",
+	default=0.3,
+	show_default=True,
+	type=click.FloatRange(0, 1),
+	help="Share of requests that call get_punch_logs instead of report_operation",
+)
+@click.option(
+	"--rejection-rate",
+	default=0.05,
+	show_default=True,
+	type=click.FloatRange(0, 1),
+	help="Share of punches that carry a rejected unit",
+)
+@click.option("--max-batch", default=3, show_default=True, help="Maximum produced qty per punch")
+@click.option("--think-time", default=0, show_default=True, help="Maximum pause between requests (ms)")
+@click.option("--work-orders", default=5, show_default=True)
+@click.option("--employees", default=20, show_default=True)
+@click.option("--workstations", default=4, show_default=True)
+@click.option("--operations", default=3, show_default=True, help="Operations per Work Order")
+@click.option("--seed", "random_seed", type=int, help="Random seed for reproducible runs")
+@click.option("--output", type=click.Path(dir_okay=False, writable=True), help="Write the JSON result here")
+@pass_context
+def reporting_load_test(context, output=None, **options):
+	"""Seed synthetic shop-floor data and replay concurrent punch streams against the site."""
+	from reporting.reporting import load_generator
+
+	site = get_site(context)
+	nts.init(site=site)
+	nts.connect()
+	nts.set_user("Administrator")
+	try:
+		result = load_generator.run(site, sites_path=nts.local.sites_path, **options)
+	finally:
+		nts.destroy()
+
+	payload = json.dumps(result, indent=2, default=str)
+	if output:
+		with open(output, "w") as f:
+			f.write(payload)
+	click.echo(payload)
+	if result["aborted"]:
+		raise click.ClickException(f"{len(result['failed_terminals'])} terminal(s) failed to connect.")
+
+
+commands = [reporting_load_test]
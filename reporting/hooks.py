@@ -147,6 +147,14 @@ doctype_js = {
 # 	}
 # }
 
+doc_events = {
+	"Operation Punch Log": {
+		"after_insert": "reporting.reporting.punch_log_cache.on_punch_log_change",
+		"on_update": "reporting.reporting.punch_log_cache.on_punch_log_change",
+		"on_trash": "reporting.reporting.punch_log_cache.on_punch_log_change",
+	}
+}
+
 # Scheduled Tasks
 # ---------------
 
@@ -168,6 +176,12 @@ doctype_js = {
 # 	],
 # }
 
+scheduler_events = {
+	"daily_long": [
+		"reporting.reporting.punch_compaction.compact_punch_logs"
+	],
+}
+
 # Testing
 # -------
 
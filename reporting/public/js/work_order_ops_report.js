@@ -27,32 +27,79 @@ nts.provide("reporting_ops");
       .r-operation-partial{background-color:#fff3cd;}
       .r-qty-hint{color:#28a745;font-size:0.9em;font-style:italic}
       .r-rejection-reason{color:#dc3545;font-size:0.85em;font-style:italic}
+      .r-col-eta{width:110px;color:#555}
+      .r-punch-pending{color:#8a6d3b;font-style:italic;background:#fcf8e3}
     `;
     document.head.appendChild(s);
   }
 
   const HOST_FIELD = "r_operations_reporting_html";
-  nts.ui.form.on("Work Order", { refresh: function(frm) { render(frm); } });
+  // work_order -> {version, logs} from the last get_punch_logs response
+  const punch_cache = {};
+
+  // Offline punch queue: punches stay in IndexedDB until the server has confirmed them
+  const QUEUE_DB = "reporting_punch_queue";
+  const QUEUE_STORE = "punches";
+  const SYNC_BATCH = 20;
+  const SYNC_MIN_RETRY_MS = 2000;
+  const SYNC_MAX_RETRY_MS = 60000;
+  // A punch still hitting lock contention after this many syncs is reported as failed
+  const SYNC_MAX_ATTEMPTS = 10;
+  const queue = open_queue();
+  const sync = { running: false, retry_ms: 0, timer: null, frm: null };
+  window.addEventListener("online", () => flush_queue());
+
+  nts.ui.form.on("Work Order", { refresh: function(frm) { render(frm); flush_queue(frm); } });
 
   function flt_zero(v) { return (typeof v === "number") ? v : (parseFloat(v) || 0); }
   function escapeHtml(s) { if (!s && s !== 0) return ""; return String(s).replace(/[&<>"'`=\/]/g, ch => ({ "&":"&amp;","<":"&lt;",">":"&gt;",'"':"&quot;","'":"&#39;","/":"&#x2F;","`":"&#x60;","=":"&#x3D;" })[ch]); }
   function required(op, wo) { let q = flt_zero(op.operation_qty || op.for_quantity || op.qty || op.required_qty); if (q > 0) return q; return flt_zero(wo.qty || wo.production_qty || wo.for_quantity || wo.qty_to_manufacture); }
 
+  function pending_qty(frm, idx) {
+    const ops = frm.doc.operations || [];
+    const o = ops[idx];
+    const q = queued_sums(frm, idx);
+    const done = flt_zero(o.completed_qty) + flt_zero(o.process_loss_qty) + q.prod + q.rej;
+    if (idx === 0) {
+      // First operation gets full quantity
+      return Math.max(0, required(o, frm.doc) - done);
+    }
+    // Subsequent operations get completed qty (including queued punches) from previous operation
+    const prev = ops[idx - 1] || {};
+    const prev_completed = flt_zero(prev.completed_qty) + queued_sums(frm, idx - 1).prod;
+    return Math.max(0, prev_completed - done);
+  }
+
   function render(frm) {
     if (!frm.fields_dict || !frm.fields_dict[HOST_FIELD]) return;
     const ops = frm.doc.operations || [];
     if (!ops.length) { frm.fields_dict[HOST_FIELD].html("<div>No operations</div>"); return; }
 
-    // fetch punch logs first
+    queue.all().catch(() => []).then(rows => {
+      frm.__r_queued = rows.filter(p => p.work_order === frm.doc.name);
+      load_punch_logs(frm);
+    });
+  }
+
+  function load_punch_logs(frm) {
+    // fetch punch logs first; skip the payload when our cached version is still current
+    const cached = punch_cache[frm.doc.name];
     nts.call({
       method: "reporting.reporting.api.work_order_ops.get_punch_logs",
-      args: { work_order: frm.doc.name },
+      args: { work_order: frm.doc.name, known_version: cached ? cached.version : "" },
       callback: function(r) {
-        const logs_map = (r && r.message) ? r.message : {};
+        const resp = (r && r.message) ? r.message : {};
+        let logs_map = resp.logs || {};
+        if (cached && (resp.not_modified || resp.version === null)) {
+          // not modified, or the server could not read the logs: keep showing what we have
+          logs_map = cached.logs;
+        } else if (resp.version !== undefined && resp.version !== null) {
+          punch_cache[frm.doc.name] = { version: resp.version, logs: logs_map };
+        }
         build_table(frm, logs_map);
       },
       error: function() {
-        build_table(frm, {});
+        build_table(frm, cached ? cached.logs : {});
       }
     });
   }
@@ -64,21 +111,7 @@ nts.provide("reporting_ops");
     // Find first operation with remaining quantity following ERPNext logic
     let first_pending = null;
     for (let i = 0; i < ops.length; i++) {
-      const o = ops[i];
-      const req = required(o, frm.doc);
-      const done = flt_zero(o.completed_qty) + flt_zero(o.process_loss_qty);
-      
-      let pending;
-      if (i === 0) {
-        // First operation gets full quantity
-        pending = Math.max(0, req - done);
-      } else {
-        // Subsequent operations get completed qty from previous operation
-        const prev = ops[i - 1] || {};
-        const prev_completed = flt_zero(prev.completed_qty);
-        pending = Math.max(0, prev_completed - done);
-      }
-      
+      const pending = pending_qty(frm, i);
       if (pending > 1e-9) { 
         first_pending = i; 
         break; 
@@ -88,6 +121,7 @@ nts.provide("reporting_ops");
     let h = `<table class="r-report-table"><thead><tr>
       <th class="r-col-num">#</th>
       <th class="r-col-op">Operation</th>
+      <th class="r-col-eta">Est. Remaining</th>
       <th class="r-col-com">Completed</th>
       <th class="r-col-rej">Rejected</th>
       <th class="r-col-ws">Workstation</th>
@@ -97,25 +131,27 @@ nts.provide("reporting_ops");
     </tr></thead><tbody>`;
 
     ops.forEach((o, idx) => {
-      const req = required(o, frm.doc);
       const done = flt_zero(o.completed_qty) + flt_zero(o.process_loss_qty);
-      let pending;
-      if (idx === 0) {
-        pending = Math.max(0, req - done);
-      } else {
-        const prev = (frm.doc.operations || [])[idx - 1] || {};
-        const prev_completed = flt_zero(prev.completed_qty);
-        pending = Math.max(0, prev_completed - done);
-      }
+      const pending = pending_qty(frm, idx);
       
       const show_btn = started && first_pending === idx && pending > 1e-9;
-      const punches = logs_map[idx] || [];
+      const queued = queued_for(frm, idx).map(p => ({
+        employee_name: p.employee_name,
+        employee_number: p.employee_number,
+        produced_qty: p.produced_qty,
+        rejected_qty: p.process_loss,
+        rejection_reason: p.rejection_reason,
+        posting_datetime: p.posting_datetime,
+        _pending: true
+      }));
+      const punches = (logs_map[idx] || []).concat(queued);
       const is_completed = o.op_reported || (pending <= 1e-9);
       const row_class = is_completed ? "r-operation-completed" : (done > 1e-9 ? "r-operation-partial" : "");
 
       h += `<tr data-idx="${idx}" class="${row_class}">`;
       h += `<td class="r-col-num" rowspan="${Math.max(1, punches.length) + 1}">${o.idx || idx+1}</td>`;
       h += `<td class="r-col-op" rowspan="${Math.max(1, punches.length) + 1}">${escapeHtml(o.operation || "")}</td>`;
+      h += `<td class="r-col-eta r-eta-cell" data-idx="${idx}" rowspan="${Math.max(1, punches.length) + 1}">…</td>`;
       h += `<td class="r-col-com">${o.completed_qty || 0}</td>`;
       h += `<td class="r-col-rej">${o.process_loss_qty || 0}</td>`;
       h += `<td class="r-col-ws">${escapeHtml(o.workstation || "")}</td>`;
@@ -175,13 +211,16 @@ nts.provide("reporting_ops");
             }
           }
           
-          h += `<tr class="r-punch-row">`;
+          h += `<tr class="r-punch-row${p._pending ? " r-punch-pending" : ""}">`;
           h += `<td class="r-col-com">${p.produced_qty || 0}</td>`;
           h += `<td class="r-col-rej">${p.rejected_qty || 0}${p.rejection_reason ? '<br><span class="r-rejection-reason">' + escapeHtml(p.rejection_reason) + '</span>' : ''}</td>`;
           h += `<td class="r-col-ws r-empty-cell">—</td>`; // No workstation field in your doctype
           h += `<td class="r-reporter-cell">${escapeHtml(display_name || "—")}</td>`;
           h += `<td class="r-col-date">${escapeHtml(display_datetime)}</td>`;
-          h += `<td class="r-col-date">Punch #${punches.indexOf(p) + 1}</td>`;
+          let punch_label = `Punch #${punches.indexOf(p) + 1}`;
+          if (p._pending) punch_label = "Pending sync";
+          else if (p.is_summary) punch_label = `Summary of ${p.punch_count || 0} punches`;
+          h += `<td class="r-col-date">${punch_label}</td>`;
           h += `</tr>`;
         });
       } else {
@@ -204,35 +243,61 @@ nts.provide("reporting_ops");
       • Rejection reason required when rejecting quantities<br>
       • System follows ERPNext quantity flow: rejections stay in operation, only completed qty flows to next operation<br>
       • System automatically completes operation and Job Card when all quantities are reported<br>
-      • All punches are logged for audit trail
+      • All punches are logged for audit trail; punches older than a week are shown as hourly summaries<br>
+      • Without a connection punches are saved on this device (Pending sync) and sent automatically once it returns
     </div>`;
 
     frm.fields_dict[HOST_FIELD].html(h);
 
     const $wrap = frm.fields_dict[HOST_FIELD].$wrapper;
+    load_eta(frm, $wrap);
     $wrap.find(".r-report-btn").off("click").on("click", function() {
       const idx = parseInt(this.getAttribute("data-idx"), 10);
-      // reload doc lightly then show dialog
-      frm.reload_doc().then(() => {
-        const fresh = cur_frm.doc.operations || [];
-        const op = fresh[idx];
-        if (!op) { nts.msgprint("Operation not found."); frm.reload_doc(); return; }
+      const open_current = () => {
+        const op = (frm.doc.operations || [])[idx];
+        if (!op) { nts.msgprint("Operation not found."); return; }
         open_dialog(frm, op, idx);
-      }).catch(() => { nts.msgprint("Unable to refresh Work Order. Try again."); });
+      };
+      // Offline: work from the loaded document plus queued punches
+      if (!navigator.onLine) { open_current(); return; }
+      // reload doc lightly then show dialog
+      frm.reload_doc().then(open_current).catch(open_current);
+    });
+  }
+
+  function format_minutes(m) {
+    if (m === null || m === undefined) return "—";
+    if (m <= 0) return "Done";
+    if (m < 60) return Math.ceil(m) + " min";
+    const hrs = Math.floor(m / 60);
+    return hrs + " h " + Math.round(m - hrs * 60) + " min";
+  }
+
+  function load_eta(frm, $wrap) {
+    nts.call({
+      method: "reporting.reporting.api.work_order_ops.get_operation_eta",
+      args: { work_order: frm.doc.name },
+      callback: function(r) {
+        const ops = (r && r.message && r.message.operations) || [];
+        ops.forEach(function(e) {
+          const $cell = $wrap.find(`.r-eta-cell[data-idx="${e.op_index}"]`);
+          let text = format_minutes(e.remaining_minutes);
+          if (e.remaining_minutes === null && e.remaining_units > 1e-9) text = "No history";
+          $cell.text(text);
+          if (e.eta && e.remaining_minutes > 0) {
+            const rate = flt_zero(e.units_per_min).toFixed(2);
+            $cell.attr("title", `Finishes ~${new Date(e.eta).toLocaleString()} at ${rate} units/min`);
+          }
+        });
+      },
+      error: function() {
+        $wrap.find(".r-eta-cell").text("—");
+      }
     });
   }
 
   function open_dialog(frm, op, idx) {
-    const req = required(op, frm.doc);
-    const done = flt_zero(op.completed_qty) + flt_zero(op.process_loss_qty);
-    let pending;
-    if (idx === 0) {
-      pending = Math.max(0, req - done);
-    } else {
-      const prev = (frm.doc.operations || [])[idx - 1] || {};
-      const prev_completed = flt_zero(prev.completed_qty);
-      pending = Math.max(0, prev_completed - done);
-    }
+    const pending = pending_qty(frm, idx);
 
     const d = new nts.ui.Dialog({
       title: "Report " + (op.operation || "") + " (Remaining: " + pending.toFixed(2) + ")",
@@ -303,113 +368,207 @@ nts.provide("reporting_ops");
     d.show();
   }
 
+  function new_punch_id() {
+    if (window.crypto && window.crypto.randomUUID) return window.crypto.randomUUID();
+    return Date.now().toString(36) + "-" + Math.random().toString(36).slice(2, 12);
+  }
+
   function submit_report(frm, op, idx, values, pending, dialog) {
-    const produced = flt_zero(values.prod);
-    const rej = flt_zero(values.rej);
-    
-    // Auto-detect if this will complete the operation
-    const will_complete = Math.abs((produced + rej) - pending) <= 1e-6;
-    
-    nts.call({
-      method: "reporting.reporting.api.work_order_ops.report_operation",
-      args: {
-        work_order: frm.doc.name,
-        op_index: idx,
-        operation_name: op.operation || "",
-        employee_number: values.empno,
-        produced_qty: produced,
-        process_loss: rej,
-        posting_datetime: nts.datetime.now_datetime(),
-        rejection_reason: values.rejection_reason || null
-      },
-      freeze: true,
-      freeze_message: "Reporting...",
-      callback: function(r) {
-        try {
-          const resp = r && r.message ? r.message : (r || {});
-          if (resp.ok) {
-            dialog.hide();
-            let msg = resp.message || "Reported successfully.";
-            
-            if (resp.operation_completed) {
-              msg += "<br><strong>✓ Operation completed and Job Card submitted!</strong>";
-            } else if (resp.remaining > 1e-9) {
-              msg += `<br>Operation remains open. You can report the remaining ${resp.remaining.toFixed(2)} qty in next punch.`;
-            }
-            
-            nts.msgprint({
-              title: will_complete ? "Operation Completed!" : "Partial Punch Recorded",
-              message: msg,
-              indicator: will_complete ? "green" : "blue"
-            });
-            
-            // Refresh to show updated data
-            frm.reload_doc();
-          } else {
-            dialog.hide();
-            const err = resp.error_message || "Reporting failed.";
-            const tb = resp.traceback;
-            if (tb) {
-              const error_dialog = new nts.ui.Dialog({
-                title: "Server Error",
-                fields: [
-                  {label:"Error", fieldname:"err", fieldtype:"Small Text", read_only:1},
-                  {label:"Details", fieldname:"tb", fieldtype:"Code", read_only:1}
-                ],
-                primary_action_label: "Close",
-                primary_action: function(){ error_dialog.hide(); }
+    const punch = {
+      client_punch_id: new_punch_id(),
+      work_order: frm.doc.name,
+      op_index: idx,
+      operation_name: op.operation || "",
+      employee_number: values.empno,
+      employee_name: values.empname || "",
+      produced_qty: flt_zero(values.prod),
+      process_loss: flt_zero(values.rej),
+      posting_datetime: nts.datetime.now_datetime(),
+      rejection_reason: values.rejection_reason || null,
+      queued_at: Date.now()
+    };
+
+    queue.put(punch).then(() => {
+      dialog.hide();
+      render(frm);
+      flush_queue(frm, punch.client_punch_id);
+    }).catch(() => {
+      nts.msgprint({ title: "Error", message: "Unable to store the punch on this device.", indicator: "red" });
+    });
+  }
+
+  // ---- offline punch queue ------------------------------------------------
+
+  function open_queue() {
+    const memory = {};
+    const mem_queue = {
+      put: p => { memory[p.client_punch_id] = p; return Promise.resolve(); },
+      remove: id => { delete memory[id]; return Promise.resolve(); },
+      all: () => Promise.resolve(Object.values(memory))
+    };
+    if (!window.indexedDB) return mem_queue;
+
+    const db = new Promise((resolve, reject) => {
+      const req = window.indexedDB.open(QUEUE_DB, 1);
+      req.onupgradeneeded = () => req.result.createObjectStore(QUEUE_STORE, { keyPath: "client_punch_id" });
+      req.onsuccess = () => resolve(req.result);
+      req.onerror = () => reject(req.error);
+    });
+    function tx(mode, fn) {
+      return db.then(d => new Promise((resolve, reject) => {
+        const t = d.transaction(QUEUE_STORE, mode);
+        const out = fn(t.objectStore(QUEUE_STORE));
+        t.oncomplete = () => resolve(out && out.result);
+        t.onerror = () => reject(t.error);
+      }));
+    }
+    // Private browsing and quota errors fall back to memory for this page
+    return {
+      put: p => tx("readwrite", st => st.put(p)).catch(() => mem_queue.put(p)),
+      remove: id => tx("readwrite", st => st.delete(id)).catch(() => mem_queue.remove(id)),
+      all: () => tx("readonly", st => st.getAll()).catch(() => [])
+        .then(rows => (rows || []).concat(Object.values(memory)))
+    };
+  }
+
+  function queued_for(frm, idx) {
+    return (frm.__r_queued || []).filter(p => p.op_index === idx);
+  }
+
+  function queued_sums(frm, idx) {
+    return queued_for(frm, idx).reduce((acc, p) => {
+      acc.prod += flt_zero(p.produced_qty);
+      acc.rej += flt_zero(p.process_loss);
+      return acc;
+    }, { prod: 0, rej: 0 });
+  }
+
+  function schedule_retry(frm) {
+    // Exponential backoff with jitter so terminals coming back together don't sync in lockstep
+    sync.retry_ms = Math.min(SYNC_MAX_RETRY_MS, Math.max(SYNC_MIN_RETRY_MS, sync.retry_ms * 2));
+    clearTimeout(sync.timer);
+    sync.timer = setTimeout(() => flush_queue(frm), sync.retry_ms / 2 + Math.random() * sync.retry_ms / 2);
+  }
+
+  function flush_queue(frm, interactive_id) {
+    if (frm) sync.frm = frm;
+    frm = sync.frm;
+    if (sync.running) return;
+    if (!navigator.onLine) {
+      if (interactive_id) nts.show_alert({ message: "Offline: punch saved and will sync automatically.", indicator: "orange" });
+      return;
+    }
+
+    sync.running = true;
+    const outcome = { applied: 0, errors: [], single: null, stalled: null };
+
+    const next_batch = () => queue.all().then(rows => {
+      rows.sort((a, b) => a.queued_at - b.queued_at);
+      const batch = rows.slice(0, SYNC_BATCH);
+      if (!batch.length) return finish(true);
+
+      nts.call({
+        method: "reporting.reporting.api.work_order_ops.report_operations_batch",
+        args: { punches: batch.map(p => {
+          const args = Object.assign({}, p);
+          delete args.queued_at;
+          delete args.employee_name;
+          delete args.attempts;
+          return args;
+        }) },
+        callback: function(r) {
+          const results = (r && r.message) || [];
+          let retry = false;
+          let stopped = false;
+          const removals = results.map((res, i) => {
+            const sent = batch[i];
+            if (!res.ok && res.retryable) {
+              // Punches after the one that stopped the batch were not attempted
+              if (stopped) return Promise.resolve();
+              stopped = true;
+              // Lock contention stays queued for the next attempt, up to SYNC_MAX_ATTEMPTS
+              sent.attempts = (sent.attempts || 0) + 1;
+              if (sent.attempts < SYNC_MAX_ATTEMPTS) {
+                retry = true;
+                outcome.stalled = res.error_message || "Reporting failed.";
+                return queue.put(sent);
+              }
+              res = Object.assign({}, res, {
+                retryable: false,
+                error_message: `Gave up after ${sent.attempts} attempts: ${res.error_message || "Reporting failed."}`
               });
-              error_dialog.set_value("err", err);
-              error_dialog.set_value("tb", tb);
-              error_dialog.show();
+            }
+            if (res.ok) {
+              outcome.applied += 1;
             } else {
-              nts.msgprint({
-                title: "Error",
-                message: err,
-                indicator: "red"
-              });
+              outcome.errors.push(`${escapeHtml(sent.operation_name)} (${sent.produced_qty}/${sent.process_loss}): ${escapeHtml(res.error_message || "Reporting failed.")}`);
             }
-            frm.reload_doc();
-          }
-        } catch (e) {
-          dialog.hide();
-          nts.msgprint({
-            title: "Success",
-            message: "Punch recorded successfully (UI update issue).",
-            indicator: "green"
+            if (interactive_id && sent.client_punch_id === interactive_id && rows.length === 1) outcome.single = res;
+            return queue.remove(sent.client_punch_id);
           });
-          frm.reload_doc();
-        }
-      },
-      error: function(err) {
-        dialog.hide();
-        try {
-          const srv = err && err.responseJSON && err.responseJSON._server_messages ? 
-                      JSON.parse(err.responseJSON._server_messages)[0] : 
-                      (err && err.responseJSON && err.responseJSON.message ? err.responseJSON.message : null);
-          if (srv) { 
-            nts.msgprint({
-              title: "Server Error",
-              message: String(srv),
-              indicator: "red"
-            });
-          } else { 
-            nts.msgprint({
-              title: "Error",
-              message: "Failed to report. Please contact administrator.",
-              indicator: "red"
-            });
-          }
-        } catch (e) {
-          nts.msgprint({
-            title: "Error", 
-            message: "Failed to report. Please contact administrator.",
-            indicator: "red"
+          Promise.all(removals).then(() => {
+            if (retry) finish(false);
+            else if (results.length) next_batch();
+            else finish(true);
           });
+        },
+        error: function() {
+          finish(false);
         }
-        frm.reload_doc();
-      }
+      });
     });
+
+    function finish(drained) {
+      sync.running = false;
+      if (drained) {
+        sync.retry_ms = 0;
+      } else {
+        if (outcome.stalled) {
+          // Shown on background flushes too: queued punches are waiting behind this one
+          nts.show_alert({ message: `Punch sync stalled: ${escapeHtml(outcome.stalled)}. Retrying automatically.`, indicator: "red" });
+        } else if (interactive_id) {
+          nts.show_alert({ message: "Punch saved on this device; sync will be retried automatically.", indicator: "orange" });
+        }
+        schedule_retry(frm);
+      }
+      if (outcome.single) {
+        show_punch_result(outcome.single);
+      } else if (outcome.applied || outcome.errors.length) {
+        let msg = `${outcome.applied} queued punch(es) synced.`;
+        if (outcome.errors.length) msg += "<br><br><strong>Not applied:</strong><br>" + outcome.errors.join("<br>");
+        nts.msgprint({
+          title: outcome.errors.length ? "Punch Sync Finished With Errors" : "Punches Synced",
+          message: msg,
+          indicator: outcome.errors.length ? "orange" : "green"
+        });
+      }
+      // One reload per flush instead of one per punch
+      if (frm && (outcome.applied || outcome.errors.length)) frm.reload_doc();
+    }
+
+    next_batch().catch(() => finish(false));
+  }
+
+  function show_punch_result(resp) {
+    if (resp.ok) {
+      let msg = resp.message || "Reported successfully.";
+      if (resp.operation_completed) {
+        msg += "<br><strong>✓ Operation completed and Job Card submitted!</strong>";
+      } else if (resp.remaining > 1e-9) {
+        msg += `<br>Operation remains open. You can report the remaining ${resp.remaining.toFixed(2)} qty in next punch.`;
+      }
+      nts.msgprint({
+        title: resp.operation_completed ? "Operation Completed!" : "Partial Punch Recorded",
+        message: msg,
+        indicator: resp.operation_completed ? "green" : "blue"
+      });
+    } else {
+      nts.msgprint({
+        title: "Error",
+        message: escapeHtml(resp.error_message || "Reporting failed."),
+        indicator: "red"
+      });
+    }
   }
 
 })();
\ No newline at end of file
@@ -5,10 +5,23 @@
 # - Fixed missing fields in Operation Punch Log
 import nts
 from nts import _
-from nts.utils import flt, get_datetime, now_datetime
+from nts.utils import flt, get_datetime, now_datetime, strip_html
 from datetime import timedelta
+import json
 import traceback
 from nts import log_error
+from reporting.reporting import cycle_stats, punch_log_cache
+from reporting.reporting.unit_of_work import UnitOfWork
+
+# Upper bound on punches applied by one report_operations_batch call
+MAX_SYNC_BATCH = 50
+
+class PunchWriteError(nts.ValidationError):
+    """The punch was valid but its writes failed and were rolled back"""
+
+def _is_retryable(exc):
+    """Only lock contention is transient; anything else fails the same way when sent again"""
+    return isinstance(exc, (nts.QueryDeadlockError, nts.QueryTimeoutError))
 
 def _make_name(prefix="OPLOG"):
     import uuid
@@ -49,8 +62,9 @@ def _get_table_columns(table_name: str):
 
 def _insert_operation_punch_log(parent_work_order, parent_op_idx, parent_op_name,
                                 employee_number, employee_name, produced_qty, rejected_qty, 
-                                posting_datetime, processed_flag, rejection_reason=None):
-    """Insert punch log with proper ERPNext fields"""
+                                posting_datetime, processed_flag, rejection_reason=None, client_punch_id=None,
+                                commit=True):
+    """Insert punch log with proper ERPNext fields (commit=False leaves it to the caller's transaction)"""
     table = "tabOperation Punch Log"
     if not _table_exists(table):
         log_error("tabOperation Punch Log does not exist. Skipping punch log insert.", "punch_log_missing")
@@ -69,6 +83,7 @@ def _insert_operation_punch_log(parent_work_order, parent_op_idx, parent_op_name
         "posting_datetime": posting_datetime,
         "processed": processed_flag,
         "rejection_reason": rejection_reason,
+        "client_punch_id": client_punch_id,
         "creation": now_datetime(),
         "modified": now_datetime(),
         "modified_by": nts.session.user,
@@ -93,100 +108,244 @@ def _insert_operation_punch_log(parent_work_order, parent_op_idx, parent_op_name
         query = f"INSERT INTO `{table}` ({col_fragment}) VALUES ({placeholder_fragment})"
         
         nts.db.sql(query, tuple(values))
-        nts.db.commit()
+        if commit:
+            nts.db.commit()
         return filtered_data.get("name")
     except Exception:
+        if not commit:
+            # Part of the caller's transaction: let it roll back instead of applying totals without a punch
+            raise
         log_error(traceback.format_exc(), "punch_log_insert_error")
         return None
 
-def _set_job_card_completed(jc_name):
-    """Submit Job Card properly"""
-    try:
-        nts.db.sql("UPDATE `tabJob Card` SET status=%s, docstatus=1 WHERE name=%s", ("Completed", jc_name))
-        nts.db.commit()
-        return True
-    except Exception:
-        log_error(traceback.format_exc(), "job_card_submit_failed")
-        return False
-
-def _update_work_order_operation_totals(op_row, produced_qty, process_loss, work_order_name, idx):
-    """Update Work Order Operation totals"""
-    try:
-        if op_row.get("name"):
-            nts.db.sql("""UPDATE `tabWork Order Operation`
-                          SET completed_qty=COALESCE(completed_qty,0)+%s,
-                              process_loss_qty=COALESCE(process_loss_qty,0)+%s
-                          WHERE name=%s""", (produced_qty, process_loss, op_row.get("name")))
-        else:
-            nts.db.sql("""UPDATE `tabWork Order Operation`
-                          SET completed_qty=COALESCE(completed_qty,0)+%s,
-                              process_loss_qty=COALESCE(process_loss_qty,0)+%s
-                          WHERE parent=%s AND idx=%s""", 
-                          (produced_qty, process_loss, work_order_name, op_row.get("idx") or (idx+1)))
-        nts.db.commit()
-        return True
-    except Exception:
-        log_error(traceback.format_exc(), "update_work_order_operation_failed")
-        return False
+def _op_row_where(op_row, work_order_name, idx):
+    """Row key of a Work Order Operation for the unit of work"""
+    if op_row.get("name"):
+        return {"name": op_row.get("name")}
+    return {"parent": work_order_name, "idx": op_row.get("idx") or (idx+1)}
 
-def _mark_operation_completed(op_row, work_order_name, idx):
-    """Mark operation as completed"""
-    try:
-        if op_row.get("name"):
-            nts.db.sql("UPDATE `tabWork Order Operation` SET op_reported=1 WHERE name=%s", (op_row.get("name"),))
-        else:
-            nts.db.sql("UPDATE `tabWork Order Operation` SET op_reported=1 WHERE parent=%s AND idx=%s", 
-                      (work_order_name, op_row.get("idx") or (idx+1)))
-        nts.db.commit()
-        return True
-    except Exception:
-        log_error(traceback.format_exc(), "mark_operation_completed_failed")
-        return False
-
-@nts.whitelist()
-def get_punch_logs(work_order):
-    """Get punch logs for display"""
+def _stage_punch_writes(uow, op_row, work_order_name, idx, jc_name, produced_qty, process_loss,
+                        complete=False, total_completed=None, reporter_name=None, reported_dt=None):
+    """
+    Stage the row changes of one punch: Work Order Operation totals, Job Card totals and,
+    on the completing punch, op_reported, reporter info and Job Card completion.
+    Flushing writes at most one UPDATE per row.
+    """
+    op_where = _op_row_where(op_row, work_order_name, idx)
+    jc_where = {"name": jc_name}
+    uow.increment("tabWork Order Operation", op_where, completed_qty=produced_qty, process_loss_qty=process_loss)
+    if total_completed is not None:
+        uow.set("tabJob Card", jc_where, total_completed_qty=total_completed)
+    if complete:
+        uow.set("tabWork Order Operation", op_where, op_reported=1)
+        if reporter_name is not None:
+            uow.set("tabWork Order Operation", op_where,
+                    op_reported_by_employee_name=reporter_name, op_reported_dt=str(reported_dt))
+        uow.set("tabJob Card", jc_where, status="Completed", docstatus=1)
+    return uow
+
+def _build_punch_logs(work_order, detail=False):
+    """
+    Query punch logs of a work order grouped by operation index.
+    By default compacted punches show as their summary rows; detail=True swaps the
+    summaries for the original punches kept in Operation Punch Log Archive.
+    Raises on query errors so a failed read is never cached as an empty history.
+    """
     table = "tabOperation Punch Log"
+    archive_table = "tabOperation Punch Log Archive"
     if not _table_exists(table):
         return {}
-    try:
-        # Get available columns first
-        cols = _get_table_columns(table)
-        
-        # Build SELECT query with only existing columns
-        select_cols = ["parent_op_idx", "employee_number", "employee_name", "produced_qty", "rejected_qty", 
-                      "posting_datetime", "name", "processed"]
-        if "rejection_reason" in cols:
-            select_cols.append("rejection_reason")
-        
-        col_fragment = ", ".join(select_cols)
-        
+    # Get available columns first
+    cols = _get_table_columns(table)
+    
+    # Build SELECT query with only existing columns
+    select_cols = ["parent_op_idx", "employee_number", "employee_name", "produced_qty", "rejected_qty", 
+                  "posting_datetime", "name", "processed"]
+    for optional in ("rejection_reason", "is_summary", "punch_count", "period_start"):
+        if optional in cols:
+            select_cols.append(optional)
+    
+    col_fragment = ", ".join(select_cols)
+    
+    if detail and "is_summary" in cols and _table_exists(archive_table):
+        # Archived originals stand in for the summary rows
+        archive_defaults = {"is_summary": "0", "punch_count": "1", "period_start": "NULL"}
+        archive_cols = _get_table_columns(archive_table)
+        archive_fragment = ", ".join(
+            c if c in archive_cols and c not in archive_defaults else f"{archive_defaults.get(c, 'NULL')} AS {c}"
+            for c in select_cols)
+        rows = nts.db.sql(f"""
+            SELECT {col_fragment}
+            FROM `{table}`
+            WHERE parent_work_order=%s AND COALESCE(is_summary,0)=0
+            UNION ALL
+            SELECT {archive_fragment}
+            FROM `{archive_table}`
+            WHERE parent_work_order=%s
+            ORDER BY parent_op_idx ASC, posting_datetime ASC
+        """, (work_order, work_order), as_dict=True)
+    else:
         rows = nts.db.sql(f"""
             SELECT {col_fragment}
             FROM `{table}`
             WHERE parent_work_order=%s
             ORDER BY parent_op_idx ASC, posting_datetime ASC
         """, (work_order,), as_dict=True)
-        
-        result = {}
-        for r in rows:
-            idx = int(r.get("parent_op_idx") or 0)
-            result.setdefault(idx, []).append(r)
-        return result
+    
+    result = {}
+    for r in rows:
+        idx = int(r.get("parent_op_idx") or 0)
+        result.setdefault(idx, []).append(r)
+    return result
+
+def _find_client_punch(client_punch_id):
+    # Compacted punches keep their client_punch_id in the archive
+    for table in ("tabOperation Punch Log", "tabOperation Punch Log Archive"):
+        if "client_punch_id" not in _get_table_columns(table):
+            continue
+        rows = nts.db.sql(f"SELECT name, parent_op_idx FROM `{table}` WHERE client_punch_id=%s LIMIT 1",
+                          (client_punch_id,), as_dict=True)
+        if rows:
+            return rows[0]
+    return None
+
+def _duplicate_punch_response(client_punch_id, existing):
+    return {
+        "ok": True,
+        "duplicate": True,
+        "message": _("Punch already recorded."),
+        "client_punch_id": client_punch_id,
+        "punch_log": existing.get("name"),
+        "operation_completed": False,
+        "op_index": existing.get("parent_op_idx"),
+        "remaining": None
+    }
+
+@nts.whitelist()
+def get_punch_logs(work_order, known_version=None, detail=0):
+    """Get punch logs for display.
+
+    Served from the versioned punch log cache. When ``known_version`` is passed the
+    response is wrapped as ``{"version", "not_modified", "logs"}`` and ``logs`` is
+    omitted if the client already holds the current version. Compacted history is
+    returned as summary rows unless ``detail`` is set. Without Redis the logs are read
+    straight from the database and returned with ``version`` None.
+    """
+    detail = bool(int(detail or 0))
+    try:
+        version = punch_log_cache.get_version(work_order)
+    except Exception:
+        log_error(traceback.format_exc(), "punch_log_version_failed")
+        version = None
+    if version is not None and known_version not in (None, "") and str(known_version) == str(version):
+        punch_log_cache.record_hit()
+        return {"version": version, "not_modified": True}
+
+    try:
+        if version is None:
+            logs = _build_punch_logs(work_order, detail=detail)
+        else:
+            payload, _hit = punch_log_cache.get_cached(
+                work_order, version, lambda: _build_punch_logs(work_order, detail=detail),
+                variant="detail" if detail else None)
+            logs = json.loads(payload)
     except Exception:
+        # Nothing was cached; answer empty without a version so the client doesn't keep it either
         log_error(traceback.format_exc(), "get_punch_logs_failed")
-        return {}
+        if known_version is None:
+            return {}
+        return {"version": None, "not_modified": False, "logs": {}}
+    if known_version is None:
+        return logs
+    return {"version": version, "not_modified": False, "logs": logs}
+
+@nts.whitelist()
+def get_punch_log_cache_stats():
+    """Hit rate and memory use of the get_punch_logs cache"""
+    nts.only_for("System Manager")
+    return punch_log_cache.get_stats()
 
 @nts.whitelist()
-def report_operation(work_order, op_index, operation_name, employee_number, produced_qty, process_loss=0, posting_datetime=None, rejection_reason=None):
+def get_operation_eta(work_order):
+    """Project remaining minutes for each operation from the rolling cycle-time stats.
+
+    Remaining units flow down the routing: what an operation still has to process is
+    its expected input (previous completed qty plus the previous operation's remaining
+    units net of its rejection rate) minus what it already processed. Operations are
+    summed serially for the cumulative ETA, which is conservative when they overlap.
+    """
+    wo = nts.get_doc("Work Order", work_order)
+    operations = wo.get("operations") or []
+    wo_qty = flt(wo.get("qty") or wo.get("production_qty") or 0)
+    stats = cycle_stats.get_stats_map(
+        [(o.get("operation") or "", o.get("workstation") or wo.get("workstation") or "") for o in operations]
+    )
+
+    now = now_datetime()
+    result = []
+    cumulative = 0.0
+    unknown = False
+    prev_completed = prev_remaining = prev_rejection_rate = 0.0
+    for i, o in enumerate(operations):
+        completed = flt(o.get("completed_qty") or 0)
+        processed = completed + flt(o.get("process_loss_qty") or 0)
+        if i == 0:
+            expected_input = flt(o.get("operation_qty") or o.get("for_quantity") or o.get("qty") or 0) or wo_qty
+        else:
+            expected_input = prev_completed + prev_remaining * (1 - prev_rejection_rate)
+        remaining_units = 0.0 if o.get("op_reported") else max(0.0, expected_input - processed)
+
+        st = stats.get((o.get("operation") or "", o.get("workstation") or wo.get("workstation") or ""))
+        rate = flt(st.ewma_units_per_min) if st else 0.0
+        rejection_rate = flt(st.rejection_rate) if st else 0.0
+
+        if remaining_units <= 1e-9:
+            minutes = 0.0
+        elif rate > 0:
+            minutes = remaining_units / rate
+        else:
+            minutes = None
+            unknown = True
+
+        if minutes is not None and not unknown:
+            cumulative += minutes
+        result.append({
+            "op_index": i,
+            "operation": o.get("operation"),
+            "remaining_units": remaining_units,
+            "units_per_min": rate,
+            "p50_units_per_min": flt(st.p50_units_per_min) if st else 0.0,
+            "p90_units_per_min": flt(st.p90_units_per_min) if st else 0.0,
+            "rejection_rate": rejection_rate,
+            "samples": int(st.sample_count or 0) if st else 0,
+            "remaining_minutes": minutes,
+            "eta": str(now + timedelta(minutes=cumulative)) if not unknown else None,
+        })
+        prev_completed, prev_remaining, prev_rejection_rate = completed, remaining_units, rejection_rate
+
+    return {
+        "work_order": wo.name,
+        "operations": result,
+        "remaining_minutes": None if unknown else cumulative,
+        "eta": None if unknown else str(now + timedelta(minutes=cumulative)),
+    }
+
+@nts.whitelist()
+def report_operation(work_order, op_index, operation_name, employee_number, produced_qty, process_loss=0, posting_datetime=None, rejection_reason=None, client_punch_id=None):
     """
     Fixed implementation with proper quantity flow and rejection reason:
     - Follows ERPNext quantity flow practices
     - Captures rejection reason only when there's actual rejection
     - Proper carryover of rejections to next operations
+    - Idempotent on client_punch_id: a replayed punch is acknowledged, not applied again
     """
     produced_qty = flt(produced_qty or 0)
     process_loss = flt(process_loss or 0)
+
+    if client_punch_id:
+        existing = _find_client_punch(client_punch_id)
+        if existing:
+            return _duplicate_punch_response(client_punch_id, existing)
     
     if produced_qty <= 0 and process_loss <= 0:
         nts.throw(_("Either produced qty or rejected qty must be greater than zero."))
@@ -364,7 +523,8 @@ def report_operation(work_order, op_index, operation_name, employee_number, prod
         log_error(traceback.format_exc(), "time_log_insert_failed")
         nts.throw(_("Failed to add time log: {0}").format(str(traceback.format_exc())))
 
-    # Update Job Card's total_completed_qty field (sum of all time logs)
+    # Job Card's total_completed_qty (sum of all time logs), written by the unit of work below
+    total_completed = None
     try:
         jc_cols = _get_table_columns("tabJob Card")
         if "total_completed_qty" in jc_cols:
@@ -375,86 +535,71 @@ def report_operation(work_order, op_index, operation_name, employee_number, prod
             """, (jc_doc.name,), as_dict=True)
             
             total_completed = flt(total_result[0].get("total_completed", 0)) if total_result else 0
-            nts.db.sql("UPDATE `tabJob Card` SET total_completed_qty = %s WHERE name = %s", 
-                       (total_completed, jc_doc.name))
-            nts.db.commit()
     except Exception:
         log_error(traceback.format_exc(), "update_job_card_total_failed")
 
-    # Insert Operation Punch Log for audit trail
-    punch_name = _insert_operation_punch_log(
-        parent_work_order=wo.name,
-        parent_op_idx=idx,
-        parent_op_name=op_text,
-        employee_number=employee_number,
-        employee_name=emp_label,
-        produced_qty=produced_qty,
-        rejected_qty=process_loss,
-        posting_datetime=posting_dt,
-        processed_flag=0,
-        rejection_reason=rejection_reason if process_loss > 0 else None
+    # Reporter info is recorded on the operation when completing (fields may not exist in all systems)
+    reporter_name = None
+    if will_complete_operation:
+        wo_op_cols = _get_table_columns("tabWork Order Operation")
+        if "op_reported_by_employee_name" in wo_op_cols and "op_reported_dt" in wo_op_cols:
+            reporter_name = emp_label
+
+    # Insert the Operation Punch Log already processed and write every touched
+    # Work Order Operation / Job Card row once, in a single transaction
+    uow = _stage_punch_writes(
+        UnitOfWork(), op_row, wo.name, idx, jc_doc.name, produced_qty, process_loss,
+        complete=will_complete_operation, total_completed=total_completed,
+        reporter_name=reporter_name, reported_dt=posting_dt
     )
-
-    # Update Work Order Operation totals
-    if not _update_work_order_operation_totals(op_row, produced_qty, process_loss, wo.name, idx):
-        # Rollback time log and punch log on failure
+    try:
+        _insert_operation_punch_log(
+            parent_work_order=wo.name,
+            parent_op_idx=idx,
+            parent_op_name=op_text,
+            employee_number=employee_number,
+            employee_name=emp_label,
+            produced_qty=produced_qty,
+            rejected_qty=process_loss,
+            posting_datetime=posting_dt,
+            processed_flag=1,
+            rejection_reason=rejection_reason if process_loss > 0 else None,
+            client_punch_id=client_punch_id,
+            commit=False
+        )
+        uow.flush()
+        nts.db.commit()
+    except Exception as exc:
+        nts.db.rollback()
+        # Time log was committed on its own; remove it so totals stay consistent
         if time_log_name:
             try:
                 nts.db.sql("DELETE FROM `tabJob Card Time Log` WHERE name=%s", (time_log_name,))
                 nts.db.commit()
             except Exception:
                 pass
-        if punch_name:
-            try:
-                nts.db.sql("DELETE FROM `tabOperation Punch Log` WHERE name=%s", (punch_name,))
-                nts.db.commit()
-            except Exception:
-                pass
-        nts.throw(_("Failed to update operation totals."))
-
-    # Complete Job Card and mark operation if this is the final punch
-    if will_complete_operation:
-        if not _set_job_card_completed(jc_doc.name):
-            # Rollback on failure
-            if time_log_name:
-                try:
-                    nts.db.sql("DELETE FROM `tabJob Card Time Log` WHERE name=%s", (time_log_name,))
-                    nts.db.commit()
-                except Exception:
-                    pass
-            nts.throw(_("Failed to complete Job Card."))
-        
-        if not _mark_operation_completed(op_row, wo.name, idx):
-            nts.throw(_("Failed to mark operation as completed."))
-
-        # Update Work Order Operation with reporter info when completing
-        try:
-            # Check if reporter fields exist in Work Order Operation
-            wo_op_cols = _get_table_columns("tabWork Order Operation")
-            if "op_reported_by_employee_name" in wo_op_cols and "op_reported_dt" in wo_op_cols:
-                if op_row.get("name"):
-                    nts.db.sql("""UPDATE `tabWork Order Operation` 
-                                  SET op_reported_by_employee_name=%s, op_reported_dt=%s 
-                                  WHERE name=%s""", 
-                               (emp_label, str(posting_dt), op_row.get("name")))
-                else:
-                    nts.db.sql("""UPDATE `tabWork Order Operation` 
-                                  SET op_reported_by_employee_name=%s, op_reported_dt=%s 
-                                  WHERE parent=%s AND idx=%s""", 
-                               (emp_label, str(posting_dt), wo.name, op_row.get("idx") or (idx+1)))
-                nts.db.commit()
-        except Exception:
-            log_error(traceback.format_exc(), "update_reporter_info_failed")
-
-    # Mark punch as processed
-    if punch_name:
-        try:
-            cols = _get_table_columns("tabOperation Punch Log")
-            if "processed" in cols:
-                nts.db.sql("UPDATE `tabOperation Punch Log` SET processed=1 WHERE name=%s", (punch_name,))
-                nts.db.commit()
-        except Exception:
-            pass
+        # A concurrent replay of the same punch won the unique client_punch_id
+        if client_punch_id and nts.db.is_duplicate_entry(exc):
+            existing = _find_client_punch(client_punch_id)
+            if existing:
+                return _duplicate_punch_response(client_punch_id, existing)
+        if isinstance(exc, (nts.QueryDeadlockError, nts.QueryTimeoutError)):
+            # Surface lock contention as such so callers can retry it
+            raise
+        log_error(traceback.format_exc(), "punch_unit_of_work_failed")
+        nts.throw(_("Failed to update operation totals."), exc=PunchWriteError)
+
+    # Punch is committed: invalidate cached get_punch_logs responses for this work order
+    punch_log_cache.bump_version(wo.name)
+
+    # Cycle-time stats get their own short transaction so the shared stats row isn't locked
+    # for the whole punch; a failure here loses this sample only, never the punch
+    try:
+        cycle_stats.record_punch(wo.name, idx, op_text, workstation, produced_qty, process_loss, posting_dt)
+        nts.db.commit()
+    except Exception:
+        nts.db.rollback()
+        log_error(traceback.format_exc(), "cycle_stats_update_failed")
 
     # Calculate final remaining quantity
     try:
@@ -512,5 +657,64 @@ def report_operation(work_order, op_index, operation_name, employee_number, prod
         "rejected_qty": process_loss,
         "op_index": idx,
         "op_name": op_text,
-        "remaining": remaining
-    }
\ No newline at end of file
+        "remaining": remaining,
+        "client_punch_id": client_punch_id
+    }
+
+@nts.whitelist()
+def report_operations_batch(punches):
+    """
+    Apply punches queued by an offline terminal, in order, and return one result per punch.
+    Each punch carries the report_operation arguments plus its client_punch_id, so a batch
+    that is retried after a dropped response does not double count.
+    Lock contention (lock wait timeout, deadlock) is flagged retryable and stops the batch
+    there; the punches after it are returned unattempted so order is kept. Every other
+    failure is final for that punch.
+    """
+    if isinstance(punches, str):
+        punches = json.loads(punches)
+    punches = punches or []
+    if len(punches) > MAX_SYNC_BATCH:
+        nts.throw(_("At most {0} punches can be synced at once.").format(MAX_SYNC_BATCH))
+
+    results = []
+    for pos, p in enumerate(punches):
+        client_punch_id = p.get("client_punch_id")
+        try:
+            resp = report_operation(
+                work_order=p.get("work_order"),
+                op_index=p.get("op_index"),
+                operation_name=p.get("operation_name") or "",
+                employee_number=p.get("employee_number"),
+                produced_qty=p.get("produced_qty"),
+                process_loss=p.get("process_loss") or 0,
+                posting_datetime=p.get("posting_datetime"),
+                rejection_reason=p.get("rejection_reason"),
+                client_punch_id=client_punch_id
+            )
+            results.append(resp)
+        except Exception as exc:
+            nts.db.rollback()
+            retryable = _is_retryable(exc)
+            if not isinstance(exc, nts.ValidationError):
+                log_error(traceback.format_exc(), "batch_punch_failed")
+            results.append({
+                "ok": False,
+                "retryable": retryable,
+                "client_punch_id": client_punch_id,
+                "op_index": p.get("op_index"),
+                "error_message": strip_html(str(exc)) or _("Reporting failed.")
+            })
+            if retryable:
+                for rest in punches[pos + 1:]:
+                    results.append({
+                        "ok": False,
+                        "retryable": True,
+                        "client_punch_id": rest.get("client_punch_id"),
+                        "op_index": rest.get("op_index"),
+                        "error_message": _("Not attempted.")
+                    })
+                break
+        finally:
+            nts.clear_messages()
+    return results
\ No newline at end of file
@@ -0,0 +1,164 @@
+# Copyright (c) 2025, NTS and contributors
+# For license information, please see license.txt
+
+"""Rolling cycle-time statistics per (operation, workstation).
+
+``report_operation`` feeds every committed punch through :func:`record_punch`, which
+updates one Operation Cycle Stats row in place: totals, rejection rate, an EWMA of units per
+minute and a log-spaced histogram the percentiles are read from. The rate of a punch
+is its units divided by the time since the previous punch on the same work order
+operation, so the first punch of an operation and gaps longer than a shift only count
+towards the totals.
+
+The stats row of an (operation, workstation) is shared by every work order, so it is
+updated in its own short transaction after the punch commits rather than inside it;
+otherwise all punches on that operation would queue on its row lock. The trade-off is
+at-most-once: a stats update that fails after its punch committed is logged and that
+punch is missing from the stats, which only cost ETA accuracy.
+"""
+
+import json
+import math
+
+import nts
+from nts.utils import flt, get_datetime
+
+DOCTYPE = "Operation Cycle Stats"
+TABLE = "tabOperation Cycle Stats"
+
+EWMA_ALPHA = 0.2
+# Intervals longer than this are idle time (breaks, shift changes), not cycle time.
+MAX_INTERVAL_MINUTES = 240
+# Histogram bucket i covers [BUCKET_BASE**i, BUCKET_BASE**(i+1)) units per minute.
+BUCKET_BASE = 1.25
+MIN_BUCKET, MAX_BUCKET = -40, 40
+
+
+def stats_name(operation, workstation):
+	return f"{operation}::{workstation or ''}"
+
+
+def _bucket(units_per_min):
+	i = math.floor(math.log(units_per_min, BUCKET_BASE))
+	return max(MIN_BUCKET, min(MAX_BUCKET, i))
+
+
+def histogram_percentile(histogram, pct):
+	"""Approximate percentile (0-100) of a ``{bucket: count}`` histogram."""
+	total = sum(histogram.values())
+	if not total:
+		return 0.0
+	target = total * pct / 100.0
+	seen = 0
+	for bucket in sorted(histogram, key=int):
+		seen += histogram[bucket]
+		if seen >= target:
+			# geometric midpoint of the bucket
+			return BUCKET_BASE ** (int(bucket) + 0.5)
+	return BUCKET_BASE ** (int(max(histogram, key=int)) + 0.5)
+
+
+def apply_punch(state, produced_qty, rejected_qty, interval_minutes=None):
+	"""Return ``state`` updated with one punch; ``state`` uses the doctype's fieldnames."""
+	state = dict(state)
+	histogram = dict(state.get("histogram") or {})
+	produced_qty = flt(produced_qty)
+	rejected_qty = flt(rejected_qty)
+	units = produced_qty + rejected_qty
+
+	state["punch_count"] = int(state.get("punch_count") or 0) + 1
+	state["total_produced"] = flt(state.get("total_produced")) + produced_qty
+	state["total_rejected"] = flt(state.get("total_rejected")) + rejected_qty
+	processed = state["total_produced"] + state["total_rejected"]
+	state["rejection_rate"] = state["total_rejected"] / processed if processed else 0.0
+
+	if interval_minutes and 0 < interval_minutes <= MAX_INTERVAL_MINUTES and units > 0:
+		rate = units / interval_minutes
+		state["sample_count"] = int(state.get("sample_count") or 0) + 1
+		state["total_minutes"] = flt(state.get("total_minutes")) + interval_minutes
+		previous = flt(state.get("ewma_units_per_min"))
+		state["ewma_units_per_min"] = (
+			rate if state["sample_count"] == 1 else EWMA_ALPHA * rate + (1 - EWMA_ALPHA) * previous
+		)
+		key = str(_bucket(rate))
+		histogram[key] = histogram.get(key, 0) + 1
+		state["p50_units_per_min"] = histogram_percentile(histogram, 50)
+		state["p90_units_per_min"] = histogram_percentile(histogram, 90)
+
+	state["histogram"] = histogram
+	return state
+
+
+def _previous_punch_datetime(work_order, op_idx, posting_dt):
+	# Strictly earlier, so the committed punch being recorded isn't its own predecessor
+	rows = nts.db.sql(
+		"""SELECT MAX(posting_datetime) FROM `tabOperation Punch Log`
+		WHERE parent_work_order=%s AND parent_op_idx=%s AND posting_datetime < %s""",
+		(work_order, op_idx, posting_dt),
+	)
+	return rows[0][0] if rows and rows[0][0] else None
+
+
+def record_punch(work_order, op_idx, operation, workstation, produced_qty, rejected_qty, posting_dt):
+	"""Fold one punch into the (operation, workstation) stats row; the caller commits.
+
+	Returns the new state, or None when the Operation Cycle Stats table doesn't exist.
+	"""
+	if not nts.db.table_exists(DOCTYPE):
+		return None
+	posting_dt = get_datetime(posting_dt)
+	previous_dt = _previous_punch_datetime(work_order, op_idx, posting_dt)
+	interval = (posting_dt - get_datetime(previous_dt)).total_seconds() / 60.0 if previous_dt else None
+
+	name = stats_name(operation, workstation)
+	nts.db.sql(
+		f"""INSERT IGNORE INTO `{TABLE}` (name, operation, workstation, creation, modified, modified_by, owner)
+		VALUES (%s, %s, %s, NOW(), NOW(), %s, %s)""",
+		(name, operation, workstation or "", nts.session.user, nts.session.user),
+	)
+	row = nts.db.sql(f"SELECT * FROM `{TABLE}` WHERE name=%s FOR UPDATE", (name,), as_dict=True)[0]
+	row["histogram"] = json.loads(row.get("histogram") or "{}")
+
+	state = apply_punch(row, produced_qty, rejected_qty, interval)
+	nts.db.sql(
+		f"""UPDATE `{TABLE}` SET punch_count=%s, sample_count=%s, total_produced=%s, total_rejected=%s,
+		total_minutes=%s, rejection_rate=%s, ewma_units_per_min=%s, p50_units_per_min=%s,
+		p90_units_per_min=%s, last_punch_datetime=%s, histogram=%s, modified=NOW()
+		WHERE name=%s""",
+		(
+			state["punch_count"],
+			state.get("sample_count") or 0,
+			state["total_produced"],
+			state["total_rejected"],
+			flt(state.get("total_minutes")),
+			state["rejection_rate"],
+			flt(state.get("ewma_units_per_min")),
+			flt(state.get("p50_units_per_min")),
+			flt(state.get("p90_units_per_min")),
+			posting_dt,
+			json.dumps(state["histogram"], separators=(",", ":")),
+			name,
+		),
+	)
+	return state
+
+
+def get_stats_map(keys):
+	"""Return ``{(operation, workstation): stats}`` for the given keys in one query."""
+	names = list({stats_name(op, ws) for op, ws in keys})
+	if not names or not nts.db.table_exists(DOCTYPE):
+		return {}
+	rows = nts.get_all(
+		DOCTYPE,
+		filters={"name": ("in", names)},
+		fields=[
+			"operation",
+			"workstation",
+			"sample_count",
+			"rejection_rate",
+			"ewma_units_per_min",
+			"p50_units_per_min",
+			"p90_units_per_min",
+		],
+	)
+	return {(r.operation, r.workstation or ""): r for r in rows}
@@ -0,0 +1,9 @@
+# Copyright (c) 2025, NTS and contributors
+# For license information, please see license.txt
+
+# import nts
+from nts.model.document import Document
+
+
+class OperationCycleStats(Document):
+	pass
@@ -0,0 +1,97 @@
+# Copyright (c) 2025, NTS and Contributors
+# See license.txt
+
+from datetime import datetime
+from unittest.mock import patch
+
+import nts
+from nts.tests.utils import ntsTestCase
+
+from reporting.reporting.api import work_order_ops
+from reporting.reporting.cycle_stats import apply_punch, histogram_percentile
+
+NOW = datetime(2025, 10, 1, 8, 0, 0)
+
+
+def _work_order(operations):
+	return nts._dict(name="WO-ETA", qty=100, operations=[nts._dict(o) for o in operations])
+
+
+def _stats(operation, workstation, ewma, rejection_rate):
+	return nts._dict(
+		operation=operation,
+		workstation=workstation,
+		sample_count=10,
+		rejection_rate=rejection_rate,
+		ewma_units_per_min=ewma,
+		p50_units_per_min=ewma,
+		p90_units_per_min=ewma,
+	)
+
+
+def _eta(work_order, stats):
+	with (
+		patch.object(work_order_ops.nts, "get_doc", return_value=work_order),
+		patch.object(work_order_ops.cycle_stats, "get_stats_map", return_value=stats),
+		patch.object(work_order_ops, "now_datetime", return_value=NOW),
+	):
+		return work_order_ops.get_operation_eta(work_order.name)
+
+
+class TestOperationCycleStats(ntsTestCase):
+	def test_first_punch_only_counts_totals(self):
+		state = apply_punch({}, 10, 2)
+		self.assertEqual(state["punch_count"], 1)
+		self.assertEqual(state["total_produced"], 10)
+		self.assertAlmostEqual(state["rejection_rate"], 2 / 12)
+		self.assertFalse(state.get("sample_count"))
+
+	def test_ewma_and_percentiles(self):
+		state = apply_punch({}, 10, 0, interval_minutes=5)
+		self.assertAlmostEqual(state["ewma_units_per_min"], 2.0)
+		state = apply_punch(state, 20, 0, interval_minutes=5)
+		self.assertAlmostEqual(state["ewma_units_per_min"], 0.2 * 4.0 + 0.8 * 2.0)
+		self.assertEqual(state["sample_count"], 2)
+		self.assertLessEqual(state["p50_units_per_min"], state["p90_units_per_min"])
+
+	def test_idle_gap_is_not_a_sample(self):
+		state = apply_punch({}, 10, 0, interval_minutes=60 * 12)
+		self.assertFalse(state.get("sample_count"))
+		self.assertEqual(histogram_percentile(state["histogram"], 50), 0.0)
+
+	def test_eta_propagates_remaining_units_downstream(self):
+		wo = _work_order(
+			[
+				{"operation": "Cut", "workstation": "WS-1", "completed_qty": 40, "process_loss_qty": 0},
+				{"operation": "Weld", "workstation": "WS-2", "completed_qty": 20, "process_loss_qty": 0},
+			]
+		)
+		stats = {
+			("Cut", "WS-1"): _stats("Cut", "WS-1", 2.0, 0.1),
+			("Weld", "WS-2"): _stats("Weld", "WS-2", 1.0, 0),
+		}
+		eta = _eta(wo, stats)
+		cut, weld = eta["operations"]
+		self.assertAlmostEqual(cut["remaining_units"], 60)
+		self.assertAlmostEqual(cut["remaining_minutes"], 30)
+		# Weld receives Cut's 40 done plus 60 still to come net of Cut's 10% rejections
+		self.assertAlmostEqual(weld["remaining_units"], 40 + 60 * 0.9 - 20)
+		self.assertAlmostEqual(weld["remaining_minutes"], 74)
+		self.assertAlmostEqual(eta["remaining_minutes"], 104)
+		self.assertEqual(eta["eta"], "2025-10-01 09:44:00")
+
+	def test_eta_unknown_without_rate_history(self):
+		wo = _work_order(
+			[
+				{"operation": "Cut", "workstation": "WS-1", "completed_qty": 100, "op_reported": 1},
+				{"operation": "Paint", "workstation": "WS-3", "completed_qty": 0},
+			]
+		)
+		eta = _eta(wo, {("Cut", "WS-1"): _stats("Cut", "WS-1", 2.0, 0)})
+		cut, paint = eta["operations"]
+		self.assertEqual(cut["remaining_minutes"], 0.0)
+		self.assertEqual(paint["remaining_units"], 100)
+		self.assertIsNone(paint["remaining_minutes"])
+		self.assertIsNone(paint["eta"])
+		self.assertIsNone(eta["remaining_minutes"])
+		self.assertIsNone(eta["eta"])
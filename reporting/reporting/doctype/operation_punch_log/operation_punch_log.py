@@ -1,9 +1,15 @@
 # Copyright (c) 2025, NTS and contributors
 # For license information, please see license.txt
 
-# import nts
+import nts
 from nts.model.document import Document
 
 
 class OperationPunchLog(Document):
 	pass
+
+
+def on_doctype_update():
+	# Punch history is always read per work order operation in posting order (pending qty,
+	# previous punch for cycle stats, compaction); without it those scans lock the whole table
+	nts.db.add_index("Operation Punch Log", ["parent_work_order", "parent_op_idx", "posting_datetime"])
@@ -0,0 +1,8 @@
+// Copyright (c) 2025, NTS and contributors
+// For license information, please see license.txt
+
+// nts.ui.form.on("Operation Punch Log Archive", {
+// 	refresh(frm) {
+
+// 	},
+// });
@@ -0,0 +1,133 @@
+# Copyright (c) 2025, NTS and Contributors
+# See license.txt
+
+from datetime import timedelta
+
+import nts
+from nts.tests.utils import ntsTestCase
+from nts.utils import add_days, now_datetime
+
+from reporting.reporting import punch_log_cache
+from reporting.reporting.api.work_order_ops import get_punch_logs
+from reporting.reporting.punch_compaction import LOG_TABLE, _totals, compact_work_order
+
+WORK_ORDER = "_Test Compaction WO"
+
+# (op idx, employee, minutes after 08:00 ten days ago, produced, rejected, rejection reason)
+PUNCHES = (
+	(0, "E-1", 5, 5, 0, None),
+	(0, "E-1", 20, 3, 0, None),
+	(0, "E-1", 40, 2, 0, None),
+	(0, "E-1", 25, 0, 1, "Scratch"),
+	(0, "E-1", 50, 0, 2, "Scratch"),
+	(0, "E-1", 55, 0, 1, "Dent"),  # alone for its reason
+	(0, "E-1", 70, 4, 0, None),  # alone in the 09:00 hour
+	(0, "E-2", 10, 6, 0, None),  # alone for its employee
+	(1, "E-1", 15, 2, 0, None),
+	(1, "E-1", 45, 1, 1, "Scratch"),  # alone for its reason
+	(1, "E-1", 30, 3, 0, None),
+)
+
+
+def _insert_punch(name, op_idx, employee, posting_dt, produced, rejected, reason):
+	nts.db.sql(
+		f"""INSERT INTO `{LOG_TABLE}` (name, parent_work_order, parent_op_idx, parent_op_name,
+			employee_number, employee_name, produced_qty, rejected_qty, posting_datetime, processed,
+			workstation, rejection_reason, creation, modified, modified_by, owner, docstatus, idx)
+		VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, 1, 'WS-1', %s, NOW(), NOW(), 'Administrator',
+			'Administrator', 0, 1)""",
+		(
+			name,
+			WORK_ORDER,
+			op_idx,
+			f"Op {op_idx}",
+			employee,
+			employee,
+			produced,
+			rejected,
+			posting_dt,
+			reason,
+		),
+	)
+
+
+class TestOperationPunchLogArchive(ntsTestCase):
+	def setUp(self):
+		start = now_datetime().replace(hour=8, minute=0, second=0, microsecond=0) - timedelta(days=10)
+		self.names = []
+		for i, (op_idx, employee, minutes, produced, rejected, reason) in enumerate(PUNCHES):
+			name = f"_T-OPLOG-{i:02d}"
+			posting_dt = start + timedelta(minutes=minutes)
+			_insert_punch(name, op_idx, employee, posting_dt, produced, rejected, reason)
+			self.names.append(name)
+		# Inside the cutoff, so never compacted
+		_insert_punch("_T-OPLOG-RECENT", 0, "E-1", now_datetime(), 1, 0, None)
+		self.addCleanup(nts.db.rollback)
+
+	def _compact(self):
+		return compact_work_order(WORK_ORDER, add_days(now_datetime(), -7))
+
+	def _rows(self, **filters):
+		return nts.get_all(
+			"Operation Punch Log",
+			filters=dict(filters, parent_work_order=WORK_ORDER),
+			fields=[
+				"name",
+				"parent_op_idx",
+				"employee_number",
+				"rejection_reason",
+				"produced_qty",
+				"rejected_qty",
+				"is_summary",
+				"punch_count",
+			],
+		)
+
+	def test_compaction_keeps_totals(self):
+		before = _totals(WORK_ORDER)
+		self.assertEqual(self._compact(), 7)
+		self.assertEqual(_totals(WORK_ORDER), before)
+
+	def test_summary_rows_count_their_punches(self):
+		self._compact()
+		summaries = {
+			(r.parent_op_idx, r.employee_number, r.rejection_reason): r for r in self._rows(is_summary=1)
+		}
+		self.assertEqual(set(summaries), {(0, "E-1", None), (0, "E-1", "Scratch"), (1, "E-1", None)})
+		self.assertEqual(summaries[(0, "E-1", None)].punch_count, 3)
+		self.assertEqual(summaries[(0, "E-1", None)].produced_qty, 10)
+		self.assertEqual(summaries[(0, "E-1", "Scratch")].punch_count, 2)
+		self.assertEqual(summaries[(0, "E-1", "Scratch")].rejected_qty, 3)
+		self.assertEqual(summaries[(1, "E-1", None)].punch_count, 2)
+		self.assertEqual(summaries[(1, "E-1", None)].produced_qty, 5)
+
+	def test_singleton_groups_are_left_alone(self):
+		self._compact()
+		live = {r.name for r in self._rows(is_summary=0)}
+		singletons = {self.names[i] for i in (5, 6, 7, 9)}
+		self.assertEqual(live, singletons | {"_T-OPLOG-RECENT"})
+
+	def test_originals_are_archived_against_their_summary(self):
+		self._compact()
+		summaries = {r.name: r for r in self._rows(is_summary=1)}
+		archived = nts.get_all(
+			"Operation Punch Log Archive",
+			filters={"parent_work_order": WORK_ORDER},
+			fields=["name", "summary_punch_log"],
+		)
+		self.assertEqual({r.name for r in archived}, {self.names[i] for i in (0, 1, 2, 3, 4, 8, 10)})
+		self.assertTrue(all(r.summary_punch_log in summaries for r in archived))
+		per_summary = {}
+		for r in archived:
+			per_summary[r.summary_punch_log] = per_summary.get(r.summary_punch_log, 0) + 1
+		self.assertEqual(per_summary, {name: s.punch_count for name, s in summaries.items()})
+
+	def test_detail_punch_logs_return_the_originals(self):
+		self._compact()
+		punch_log_cache.bump_version(WORK_ORDER)
+		detail = get_punch_logs(WORK_ORDER, detail=1)
+		names = {r["name"] for rows in detail.values() for r in rows}
+		self.assertEqual(names, set(self.names) | {"_T-OPLOG-RECENT"})
+
+		compact = get_punch_logs(WORK_ORDER)
+		self.assertEqual(sum(len(rows) for rows in compact.values()), 3 + 4 + 1)
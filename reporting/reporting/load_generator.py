@@ -0,0 +1,374 @@
+# Copyright (c) 2025, NTS and contributors
+# For license information, please see license.txt
+
+"""Synthetic shop-floor load generator.
+
+Seeds a site with synthetic Work Orders, Employees and Workstations and replays
+punch streams from concurrent simulated terminals against ``report_operation``
+and ``get_punch_logs``. Used through ``bench --site <site> reporting-load-test``.
+"""
+
+import random
+import threading
+import time
+import traceback
+
+import nts
+from nts.utils import add_days, now_datetime, nowdate
+
+import reporting
+from reporting.reporting.api import work_order_ops
+
+PREFIX = "LOADGEN"
+
+# How long the replay waits for every terminal to connect before giving up
+START_TIMEOUT_S = 120
+
+
+def seed_fixture(work_orders=5, employees=20, workstations=4, operations=3, qty=100000):
+	"""Create (or reuse) the synthetic master data and return what the replay needs."""
+	company = nts.defaults.get_global_default("company") or nts.db.get_value("Company", {}, "name")
+	if not company:
+		nts.throw("A Company is required to seed load test data.")
+
+	warehouse = nts.db.get_value("Warehouse", {"company": company, "is_group": 0}, "name")
+	if not warehouse:
+		nts.throw(f"No leaf Warehouse found for company {company}.")
+
+	ws_names = [_ensure_workstation(f"{PREFIX}-WS-{i + 1:02d}") for i in range(workstations)]
+	op_names = [
+		_ensure_operation(f"{PREFIX}-OP-{i + 1:02d}", ws_names[i % len(ws_names)]) for i in range(operations)
+	]
+	emp_numbers = [_ensure_employee(f"{PREFIX}-EMP-{i + 1:04d}", company) for i in range(employees)]
+
+	fg_item = _ensure_item(f"{PREFIX}-FG")
+	rm_item = _ensure_item(f"{PREFIX}-RM")
+	bom = _ensure_bom(fg_item, rm_item, op_names, ws_names, company)
+
+	wo_names = nts.get_all(
+		"Work Order",
+		filters={"production_item": fg_item, "bom_no": bom, "docstatus": 1, "status": ("!=", "Completed")},
+		pluck="name",
+		order_by="creation asc",
+		limit=work_orders,
+	)
+	while len(wo_names) < work_orders:
+		wo = nts.get_doc(
+			{
+				"doctype": "Work Order",
+				"production_item": fg_item,
+				"bom_no": bom,
+				"qty": qty,
+				"company": company,
+				"wip_warehouse": warehouse,
+				"fg_warehouse": warehouse,
+				"skip_transfer": 1,
+			}
+		)
+		wo.insert(ignore_permissions=True)
+		wo.submit()
+		wo_names.append(wo.name)
+
+	nts.db.commit()
+	return {
+		"work_orders": wo_names,
+		"employees": emp_numbers,
+		"operations": op_names,
+		"workstations": ws_names,
+	}
+
+
+def _ensure_workstation(name):
+	if not nts.db.exists("Workstation", name):
+		nts.get_doc({"doctype": "Workstation", "workstation_name": name}).insert(ignore_permissions=True)
+	return name
+
+
+def _ensure_operation(name, workstation):
+	if not nts.db.exists("Operation", name):
+		nts.get_doc({"doctype": "Operation", "name": name, "workstation": workstation}).insert(
+			ignore_permissions=True
+		)
+	return name
+
+
+def _ensure_employee(number, company):
+	if not nts.db.exists("Employee", {"employee_number": number}):
+		nts.get_doc(
+			{
+				"doctype": "Employee",
+				"first_name": number,
+				"employee_number": number,
+				"gender": nts.db.get_value("Gender", {}, "name") or "Male",
+				"date_of_birth": add_days(nowdate(), -365 * 30),
+				"date_of_joining": add_days(nowdate(), -30),
+				"company": company,
+				"status": "Active",
+			}
+		).insert(ignore_permissions=True)
+	return number
+
+
+def _ensure_item(item_code):
+	if not nts.db.exists("Item", item_code):
+		nts.get_doc(
+			{
+				"doctype": "Item",
+				"item_code": item_code,
+				"item_name": item_code,
+				"item_group": nts.db.get_value("Item Group", {"is_group": 0}, "name") or "All Item Groups",
+				"stock_uom": "Nos",
+				"is_stock_item": 1,
+			}
+		).insert(ignore_permissions=True)
+	return item_code
+
+
+def _ensure_bom(fg_item, rm_item, op_names, ws_names, company):
+	bom = nts.db.get_value("BOM", {"item": fg_item, "docstatus": 1, "is_active": 1, "with_operations": 1}, "name")
+	if bom:
+		return bom
+	doc = nts.get_doc(
+		{
+			"doctype": "BOM",
+			"item": fg_item,
+			"company": company,
+			"quantity": 1,
+			"with_operations": 1,
+			"rm_cost_as_per": "Valuation Rate",
+			"items": [{"item_code": rm_item, "qty": 1, "rate": 1}],
+			"operations": [
+				{"operation": op, "workstation": ws_names[i % len(ws_names)], "time_in_mins": 1}
+				for i, op in enumerate(op_names)
+			],
+		}
+	)
+	doc.insert(ignore_permissions=True)
+	doc.submit()
+	return doc.name
+
+
+class Terminal(threading.Thread):
+	"""One simulated shop-floor terminal with its own site connection."""
+
+	def __init__(self, terminal_id, site, sites_path, fixture, options, start_barrier):
+		super().__init__(name=f"{PREFIX}-terminal-{terminal_id}", daemon=True)
+		self.terminal_id = terminal_id
+		self.site = site
+		self.sites_path = sites_path
+		self.fixture = fixture
+		self.options = options
+		self.start_barrier = start_barrier
+		self.rng = random.Random((options["random_seed"] or 0) * 1000 + terminal_id)
+		self.samples = {"report_operation": [], "get_punch_logs": []}
+		self.counts = {"ok": 0, "rejected": 0, "lock_errors": 0, "errors": 0}
+		self.error_samples = []
+		self.connect_error = None
+
+	def run(self):
+		try:
+			nts.init(site=self.site, sites_path=self.sites_path)
+			nts.connect()
+			nts.set_user("Administrator")
+		except Exception:
+			# e.g. max_connections reached: release everyone waiting instead of hanging the run
+			self.connect_error = traceback.format_exc(limit=3)
+			self.start_barrier.abort()
+			return
+		try:
+			try:
+				self.start_barrier.wait()
+			except threading.BrokenBarrierError:
+				return
+			for _ in range(self.options["punches"]):
+				self._step()
+				if self.options["think_time"]:
+					time.sleep(self.rng.uniform(0, self.options["think_time"]) / 1000.0)
+		finally:
+			nts.destroy()
+
+	def _pick_target(self):
+		work_orders = self.fixture["work_orders"]
+		if self.rng.random() < self.options["hotspot"]:
+			return work_orders[0], 0
+		return self.rng.choice(work_orders), self.rng.randrange(len(self.fixture["operations"]))
+
+	def _step(self):
+		work_order, op_idx = self._pick_target()
+		if self.rng.random() < self.options["read_ratio"]:
+			method = "get_punch_logs"
+			call = lambda: work_order_ops.get_punch_logs(work_order)
+		else:
+			method = "report_operation"
+			employee = self.rng.choice(self.fixture["employees"])
+			rejected = 1 if self.rng.random() < self.options["rejection_rate"] else 0
+			call = lambda: work_order_ops.report_operation(
+				work_order,
+				op_idx,
+				"",
+				employee,
+				produced_qty=self.rng.randint(1, self.options["max_batch"]),
+				process_loss=rejected,
+				rejection_reason="Load test" if rejected else None,
+			)
+
+		started = time.perf_counter()
+		try:
+			call()
+			self.counts["ok"] += 1
+		except Exception as exc:
+			nts.db.rollback()
+			outcome = _classify(exc)
+			self.counts[outcome] += 1
+			if outcome == "errors" and len(self.error_samples) < 5:
+				self.error_samples.append(traceback.format_exc(limit=3))
+		finally:
+			self.samples[method].append((time.perf_counter() - started) * 1000.0)
+			nts.clear_messages()
+
+
+def _classify(exc):
+	"""Map a failed call to its outcome by the underlying cause, not the exception raised last."""
+	seen = exc
+	while seen is not None:
+		if isinstance(seen, (nts.QueryDeadlockError, nts.QueryTimeoutError)):
+			return "lock_errors"
+		seen = seen.__cause__ or seen.__context__
+	if isinstance(exc, work_order_ops.PunchWriteError):
+		# Writes of a valid punch failed: contention or DB trouble, not a business rejection
+		return "errors"
+	if isinstance(exc, nts.ValidationError):
+		# Business rule rejections (e.g. nothing pending downstream yet) are expected traffic.
+		return "rejected"
+	return "errors"
+
+
+def _innodb_lock_status():
+	try:
+		rows = nts.db.sql("SHOW GLOBAL STATUS LIKE 'Innodb_row_lock%%'")
+		return {r[0]: int(r[1]) for r in rows}
+	except Exception:
+		return {}
+
+
+def _percentile(sorted_values, pct):
+	if not sorted_values:
+		return None
+	k = (len(sorted_values) - 1) * pct / 100.0
+	lo = int(k)
+	hi = min(lo + 1, len(sorted_values) - 1)
+	return round(sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo), 3)
+
+
+def _latency_summary(values):
+	values = sorted(values)
+	return {
+		"count": len(values),
+		"mean_ms": round(sum(values) / len(values), 3) if values else None,
+		"p50_ms": _percentile(values, 50),
+		"p90_ms": _percentile(values, 90),
+		"p95_ms": _percentile(values, 95),
+		"p99_ms": _percentile(values, 99),
+		"max_ms": round(values[-1], 3) if values else None,
+	}
+
+
+def run(
+	site,
+	sites_path=".",
+	terminals=8,
+	punches=50,
+	hotspot=0.2,
+	read_ratio=0.3,
+	rejection_rate=0.05,
+	max_batch=3,
+	think_time=0,
+	work_orders=5,
+	employees=20,
+	workstations=4,
+	operations=3,
+	random_seed=None,
+):
+	"""Seed the connected site, replay the punch streams and return the result dict.
+
+	Expects ``nts`` to be initialised and connected to ``site`` by the caller; each
+	terminal opens its own connection.
+	"""
+	fixture = seed_fixture(
+		work_orders=work_orders, employees=employees, workstations=workstations, operations=operations
+	)
+	options = {
+		"punches": punches,
+		"hotspot": hotspot,
+		"read_ratio": read_ratio,
+		"rejection_rate": rejection_rate,
+		"max_batch": max(1, max_batch),
+		"think_time": think_time,
+		"random_seed": random_seed,
+	}
+
+	barrier = threading.Barrier(terminals + 1)
+	workers = [Terminal(i, site, sites_path, fixture, options, barrier) for i in range(terminals)]
+	for w in workers:
+		w.start()
+
+	lock_before = _innodb_lock_status()
+	started_at = now_datetime()
+	try:
+		barrier.wait(timeout=START_TIMEOUT_S)
+		aborted = False
+	except threading.BrokenBarrierError:
+		# A terminal failed or timed out connecting; the run is not comparable, so none start
+		aborted = True
+	started = time.perf_counter()
+	for w in workers:
+		w.join()
+	elapsed = 0.0 if aborted else time.perf_counter() - started
+	lock_after = _innodb_lock_status()
+	failed_terminals = [
+		{"terminal": w.terminal_id, "error": w.connect_error} for w in workers if w.connect_error
+	]
+
+	counts = {"ok": 0, "rejected": 0, "lock_errors": 0, "errors": 0}
+	samples = {"report_operation": [], "get_punch_logs": []}
+	error_samples = []
+	for w in workers:
+		for k, v in w.counts.items():
+			counts[k] += v
+		for k, v in w.samples.items():
+			samples[k].extend(v)
+		error_samples.extend(w.error_samples)
+
+	total = sum(counts.values())
+	return {
+		"app_version": reporting.__version__,
+		"site": site,
+		"started_at": str(started_at),
+		"aborted": aborted,
+		"failed_terminals": failed_terminals,
+		"config": dict(
+			options,
+			terminals=terminals,
+			work_orders=work_orders,
+			employees=employees,
+			workstations=workstations,
+			operations=operations,
+		),
+		"fixture": {k: len(v) for k, v in fixture.items()},
+		"elapsed_s": round(elapsed, 3),
+		"requests": total,
+		"throughput_rps": round(total / elapsed, 3) if elapsed else None,
+		"punch_throughput_rps": round(len(samples["report_operation"]) / elapsed, 3) if elapsed else None,
+		"latency": {method: _latency_summary(values) for method, values in samples.items()},
+		"outcomes": counts,
+		"error_rate": round((counts["errors"] + counts["lock_errors"]) / total, 5) if total else 0.0,
+		"rejection_rate": round(counts["rejected"] / total, 5) if total else 0.0,
+		"lock_waits": {
+			"row_lock_waits": lock_after.get("Innodb_row_lock_waits", 0)
+			- lock_before.get("Innodb_row_lock_waits", 0),
+			"row_lock_time_ms": lock_after.get("Innodb_row_lock_time", 0)
+			- lock_before.get("Innodb_row_lock_time", 0),
+			"deadlocks_or_timeouts": counts["lock_errors"],
+		},
+		"error_samples": error_samples[:5],
+	}
@@ -0,0 +1,150 @@
+# Copyright (c) 2025, NTS and contributors
+# For license information, please see license.txt
+
+"""Compaction of fine-grained punch history.
+
+Runs on the daily_long queue. Processed punches older than the cutoff are rolled into one summary
+Operation Punch Log per (work order, op idx, employee, hour, rejection reason); the
+originals move to Operation Punch Log Archive. Each work order is compacted in its
+own transaction and rolled back unless its produced/rejected totals are unchanged.
+
+The cutoff defaults to 7 days and can be set with the ``reporting_punch_compaction_days``
+site config key. A run compacts at most 200 work orders, oldest punches first, so a large
+backlog is worked off over several nights; ``reporting_punch_compaction_work_orders``
+changes the limit.
+"""
+
+import nts
+from nts.utils import add_days, flt, now_datetime
+
+from reporting.reporting import punch_log_cache
+
+LOG_TABLE = "tabOperation Punch Log"
+ARCHIVE_TABLE = "tabOperation Punch Log Archive"
+DEFAULT_CUTOFF_DAYS = 7
+DEFAULT_MAX_WORK_ORDERS = 200
+
+# Columns copied verbatim from a punch into its archive row
+ARCHIVED_COLUMNS = (
+	"name",
+	"parent_work_order",
+	"parent_op_idx",
+	"parent_op_name",
+	"employee_number",
+	"employee_name",
+	"produced_qty",
+	"rejected_qty",
+	"posting_datetime",
+	"processed",
+	"workstation",
+	"rejection_reason",
+	"client_punch_id",
+	"creation",
+	"modified",
+	"modified_by",
+	"owner",
+)
+
+# Matches the punches of one group; rejection_reason uses NULL-safe equality
+_GROUP_FILTER = """parent_work_order=%(work_order)s AND processed=1 AND COALESCE(is_summary,0)=0
+	AND posting_datetime < %(cutoff)s AND parent_op_idx=%(op_idx)s
+	AND employee_number <=> %(employee_number)s AND rejection_reason <=> %(rejection_reason)s
+	AND posting_datetime >= %(hour)s AND posting_datetime < %(hour)s + INTERVAL 1 HOUR"""
+
+
+def compact_punch_logs(cutoff_days=None, max_work_orders=None):
+	"""Scheduler entry point: compact the work orders with the oldest compactable punches."""
+	cutoff_days = cutoff_days or nts.conf.get("reporting_punch_compaction_days") or DEFAULT_CUTOFF_DAYS
+	max_work_orders = (
+		max_work_orders or nts.conf.get("reporting_punch_compaction_work_orders") or DEFAULT_MAX_WORK_ORDERS
+	)
+	cutoff = add_days(now_datetime(), -int(cutoff_days))
+
+	work_orders = nts.db.sql_list(
+		f"""SELECT parent_work_order FROM `{LOG_TABLE}`
+		WHERE processed=1 AND COALESCE(is_summary,0)=0 AND posting_datetime < %s
+		GROUP BY parent_work_order
+		ORDER BY MIN(posting_datetime)
+		LIMIT %s""",
+		(cutoff, int(max_work_orders)),
+	)
+	compacted = {}
+	for work_order in work_orders:
+		try:
+			archived = compact_work_order(work_order, cutoff)
+			nts.db.commit()
+		except Exception:
+			nts.db.rollback()
+			nts.log_error(title=f"Punch compaction failed for {work_order}")
+			continue
+		if archived:
+			compacted[work_order] = archived
+			punch_log_cache.bump_version(work_order)
+	return compacted
+
+
+def _totals(work_order):
+	row = nts.db.sql(
+		f"""SELECT COALESCE(SUM(produced_qty),0), COALESCE(SUM(rejected_qty),0)
+		FROM `{LOG_TABLE}` WHERE parent_work_order=%s""",
+		(work_order,),
+	)[0]
+	return flt(row[0]), flt(row[1])
+
+
+def compact_work_order(work_order, cutoff):
+	"""Compact one work order inside the caller's transaction; returns the number of punches archived."""
+	filters = {"work_order": work_order, "cutoff": cutoff}
+	# Lock the candidates so a concurrent punch sync can't interleave with the move. The
+	# (parent_work_order, parent_op_idx, posting_datetime) index keeps the locks to this work order.
+	nts.db.sql(
+		f"""SELECT name FROM `{LOG_TABLE}` WHERE parent_work_order=%(work_order)s AND processed=1
+		AND COALESCE(is_summary,0)=0 AND posting_datetime < %(cutoff)s FOR UPDATE""",
+		filters,
+	)
+	before = _totals(work_order)
+	groups = nts.db.sql(
+		f"""SELECT parent_op_idx AS op_idx, employee_number, rejection_reason,
+			DATE_FORMAT(posting_datetime, '%%Y-%%m-%%d %%H:00:00') AS hour,
+			COUNT(*) AS punch_count, SUM(produced_qty) AS produced_qty, SUM(rejected_qty) AS rejected_qty,
+			MIN(posting_datetime) AS period_start, MAX(posting_datetime) AS period_end,
+			MAX(employee_name) AS employee_name, MAX(parent_op_name) AS parent_op_name,
+			MAX(workstation) AS workstation
+		FROM `{LOG_TABLE}`
+		WHERE parent_work_order=%(work_order)s AND processed=1 AND COALESCE(is_summary,0)=0
+			AND posting_datetime < %(cutoff)s
+		GROUP BY parent_op_idx, employee_number, rejection_reason, hour
+		HAVING COUNT(*) > 1""",
+		filters,
+		as_dict=True,
+	)
+
+	archived = 0
+	now = now_datetime()
+	for g in groups:
+		params = dict(g, work_order=work_order, cutoff=cutoff)
+		summary_name = f"OPLOG-{nts.generate_hash(length=12)}"
+		nts.db.sql(
+			f"""INSERT INTO `{LOG_TABLE}` (name, parent_work_order, parent_op_idx, parent_op_name,
+				employee_number, employee_name, produced_qty, rejected_qty, posting_datetime, processed,
+				workstation, rejection_reason, is_summary, punch_count, period_start,
+				creation, modified, modified_by, owner, docstatus, idx)
+			VALUES (%(summary)s, %(work_order)s, %(op_idx)s, %(parent_op_name)s,
+				%(employee_number)s, %(employee_name)s, %(produced_qty)s, %(rejected_qty)s, %(period_end)s, 1,
+				%(workstation)s, %(rejection_reason)s, 1, %(punch_count)s, %(period_start)s,
+				%(now)s, %(now)s, %(user)s, %(user)s, 0, 1)""",
+			dict(params, summary=summary_name, now=now, user=nts.session.user),
+		)
+		columns = ", ".join(f"`{c}`" for c in ARCHIVED_COLUMNS)
+		nts.db.sql(
+			f"""INSERT INTO `{ARCHIVE_TABLE}` ({columns}, summary_punch_log, archived_on, docstatus, idx)
+			SELECT {columns}, %(summary)s, %(now)s, 0, 1 FROM `{LOG_TABLE}` WHERE {_GROUP_FILTER}""",
+			dict(params, summary=summary_name, now=now),
+		)
+		nts.db.sql(f"DELETE FROM `{LOG_TABLE}` WHERE {_GROUP_FILTER}", params)
+		archived += int(g.punch_count)
+
+	after = _totals(work_order)
+	if abs(before[0] - after[0]) > 1e-9 or abs(before[1] - after[1]) > 1e-9:
+		nts.throw(f"Compaction changed the punch totals of {work_order}: {before} -> {after}")
+	return archived
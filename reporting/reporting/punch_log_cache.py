@@ -0,0 +1,159 @@
+# Copyright (c) 2025, NTS and contributors
+# For license information, please see license.txt
+
+"""Versioned response cache for ``get_punch_logs``.
+
+Each work order has a version counter in Redis that is bumped once a change to its
+punches is committed: by ``report_operation``, compaction and, for Desk edits and data
+import, the Operation Punch Log ``doc_events``. Serialized payloads live in a per-process LRU keyed by work
+order and are only served while their version still matches, so no explicit
+invalidation is needed across workers.
+"""
+
+import json
+import threading
+import time
+from collections import OrderedDict
+
+import nts
+
+VERSION_KEY = "reporting:punch_logs:version:{0}"
+STATS_KEY = "reporting:punch_logs:cache_{0}"
+
+# Upper bound on serialized payload bytes held by each worker process.
+MAX_CACHE_BYTES = 32 * 1024 * 1024
+
+
+class _LRUBytesCache:
+	"""LRU of ``key -> (version, payload_bytes)`` bounded by total payload size."""
+
+	def __init__(self, max_bytes):
+		self.max_bytes = max_bytes
+		self.size = 0
+		self._data = OrderedDict()
+		self._lock = threading.Lock()
+
+	def get(self, key, version):
+		with self._lock:
+			entry = self._data.get(key)
+			if entry is None or entry[0] != version:
+				return None
+			self._data.move_to_end(key)
+			return entry[1]
+
+	def set(self, key, version, payload):
+		if len(payload) > self.max_bytes:
+			return
+		with self._lock:
+			old = self._data.pop(key, None)
+			if old is not None:
+				self.size -= len(old[1])
+			self._data[key] = (version, payload)
+			self.size += len(payload)
+			while self.size > self.max_bytes:
+				_, (_, evicted) = self._data.popitem(last=False)
+				self.size -= len(evicted)
+
+	def clear(self):
+		with self._lock:
+			self._data.clear()
+			self.size = 0
+
+	def __len__(self):
+		return len(self._data)
+
+
+_cache = _LRUBytesCache(MAX_CACHE_BYTES)
+
+
+def _key(template, value):
+	return nts.cache().make_key(template.format(value))
+
+
+def get_version(work_order):
+	"""Return the current version token of ``work_order``'s punch logs."""
+	redis = nts.cache()
+	key = _key(VERSION_KEY, work_order)
+	version = redis.get(key)
+	if version is None:
+		# Seed from the clock so a Redis flush never replays an old token.
+		redis.set(key, int(time.time() * 1000), nx=True)
+		version = redis.get(key)
+	return int(version)
+
+
+def bump_version(work_order):
+	"""Invalidate cached punch logs of ``work_order``; call after the change is committed."""
+	try:
+		redis = nts.cache()
+		key = _key(VERSION_KEY, work_order)
+		if redis.get(key) is None:
+			get_version(work_order)
+		return redis.incr(key)
+	except Exception:
+		nts.log_error(title="punch_log_cache_bump_failed")
+		return None
+
+
+def on_punch_log_change(doc, method=None):
+	"""doc_events hook: Desk edits, deletes and data imports of Operation Punch Log."""
+	if doc.parent_work_order:
+		work_order = doc.parent_work_order
+		nts.db.after_commit.add(lambda: bump_version(work_order))
+
+
+def _record(outcome):
+	try:
+		nts.cache().incr(_key(STATS_KEY, outcome))
+	except Exception:
+		pass
+
+
+def record_hit():
+	"""Count a conditional request answered without a payload as a hit."""
+	_record("hits")
+
+
+def get_cached(work_order, version, builder, variant=None):
+	"""Return ``(payload_bytes, hit)`` for ``work_order`` at ``version``.
+
+	``builder`` is called on a miss and must return a JSON-serializable result.
+	``variant`` keeps differently shaped responses of the same work order apart;
+	they share its version.
+	"""
+	key = (work_order, variant)
+	payload = _cache.get(key, version)
+	if payload is not None:
+		_record("hits")
+		return payload, True
+
+	_record("misses")
+	payload = json.dumps(builder(), default=str, separators=(",", ":")).encode()
+	# Don't publish if a punch landed while we were building; the next read rebuilds.
+	try:
+		current = get_version(work_order)
+	except Exception:
+		current = None
+	if current == version:
+		_cache.set(key, version, payload)
+	return payload, False
+
+
+def get_stats():
+	redis = nts.cache()
+	hits = int(redis.get(_key(STATS_KEY, "hits")) or 0)
+	misses = int(redis.get(_key(STATS_KEY, "misses")) or 0)
+	return {
+		"hits": hits,
+		"misses": misses,
+		"hit_rate": round(hits / (hits + misses), 4) if (hits + misses) else 0.0,
+		"process_entries": len(_cache),
+		"process_bytes": _cache.size,
+		"process_max_bytes": _cache.max_bytes,
+	}
+
+
+def reset_stats():
+	redis = nts.cache()
+	redis.delete(_key(STATS_KEY, "hits"), _key(STATS_KEY, "misses"))
+	_cache.clear()
@@ -0,0 +1,58 @@
+# Copyright (c) 2025, NTS and Contributors
+# See license.txt
+
+import threading
+from unittest.mock import patch
+
+import nts
+from nts.tests.utils import ntsTestCase
+
+from reporting.reporting import load_generator
+from reporting.reporting.api.work_order_ops import PunchWriteError
+from reporting.reporting.load_generator import Terminal, _classify, _latency_summary, _percentile
+
+OPTIONS = {"random_seed": 1, "punches": 1, "think_time": 0}
+
+
+def _raised_from(exc, cause):
+	try:
+		raise exc from cause
+	except Exception as raised:
+		return raised
+
+
+class TestLoadGenerator(ntsTestCase):
+	def test_percentile_interpolates(self):
+		values = [10.0, 20.0, 30.0, 40.0]
+		self.assertEqual(_percentile(values, 0), 10.0)
+		self.assertEqual(_percentile(values, 50), 25.0)
+		self.assertEqual(_percentile(values, 90), 37.0)
+		self.assertEqual(_percentile(values, 100), 40.0)
+		self.assertIsNone(_percentile([], 50))
+
+	def test_latency_summary(self):
+		summary = _latency_summary([3.0, 1.0, 2.0])
+		self.assertEqual(summary["count"], 3)
+		self.assertEqual(summary["mean_ms"], 2.0)
+		self.assertEqual(summary["p50_ms"], 2.0)
+		self.assertEqual(summary["max_ms"], 3.0)
+		self.assertIsNone(_latency_summary([])["mean_ms"])
+
+	def test_classify_by_underlying_cause(self):
+		lock = _raised_from(PunchWriteError("Failed to update operation totals."), nts.QueryDeadlockError())
+		self.assertEqual(_classify(lock), "lock_errors")
+		self.assertEqual(_classify(nts.QueryTimeoutError()), "lock_errors")
+		self.assertEqual(_classify(PunchWriteError()), "errors")
+		self.assertEqual(_classify(nts.ValidationError()), "rejected")
+		self.assertEqual(_classify(TypeError()), "errors")
+
+	def test_failed_connect_aborts_the_start(self):
+		barrier = threading.Barrier(2)
+		terminal = Terminal(0, "site", ".", {}, OPTIONS, barrier)
+		with (
+			patch.object(load_generator.nts, "init", create=True),
+			patch.object(load_generator.nts, "connect", create=True, side_effect=ConnectionError("too many")),
+		):
+			terminal.run()
+		self.assertTrue(barrier.broken)
+		self.assertIn("too many", terminal.connect_error)
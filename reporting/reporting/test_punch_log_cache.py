@@ -0,0 +1,145 @@
+# Copyright (c) 2025, NTS and Contributors
+# See license.txt
+
+import json
+from unittest.mock import patch
+
+import nts
+from nts.tests.utils import ntsTestCase
+
+from reporting.reporting import punch_log_cache
+from reporting.reporting.api import work_order_ops
+from reporting.reporting.punch_log_cache import _LRUBytesCache
+
+LOGS = {0: [{"name": "OPLOG-1", "produced_qty": 5.0}]}
+
+
+class TestLRUBytesCache(ntsTestCase):
+	def test_evicts_least_recently_used_by_bytes(self):
+		cache = _LRUBytesCache(max_bytes=10)
+		cache.set("a", 1, b"aaaa")
+		cache.set("b", 1, b"bbbb")
+		self.assertEqual(cache.get("a", 1), b"aaaa")  # "b" is now least recently used
+		cache.set("c", 1, b"cccc")
+		self.assertIsNone(cache.get("b", 1))
+		self.assertEqual(cache.get("a", 1), b"aaaa")
+		self.assertEqual(cache.get("c", 1), b"cccc")
+		self.assertEqual(cache.size, 8)
+
+	def test_replacing_entry_adjusts_size(self):
+		cache = _LRUBytesCache(max_bytes=10)
+		cache.set("a", 1, b"aaaa")
+		cache.set("a", 2, b"aa")
+		self.assertEqual(cache.size, 2)
+		self.assertEqual(len(cache), 1)
+
+	def test_oversized_payload_is_not_stored(self):
+		cache = _LRUBytesCache(max_bytes=4)
+		cache.set("a", 1, b"aaaaa")
+		self.assertEqual(len(cache), 0)
+		self.assertEqual(cache.size, 0)
+
+	def test_stale_version_misses(self):
+		cache = _LRUBytesCache(max_bytes=10)
+		cache.set("a", 1, b"aaaa")
+		self.assertIsNone(cache.get("a", 2))
+
+
+class TestGetCached(ntsTestCase):
+	def setUp(self):
+		punch_log_cache._cache.clear()
+
+	def test_hit_after_miss_at_same_version(self):
+		calls = []
+
+		def builder():
+			calls.append(1)
+			return LOGS
+
+		with patch.object(punch_log_cache, "get_version", return_value=7):
+			first, hit1 = punch_log_cache.get_cached("WO-1", 7, builder)
+			second, hit2 = punch_log_cache.get_cached("WO-1", 7, builder)
+		self.assertEqual((hit1, hit2), (False, True))
+		self.assertEqual(first, second)
+		self.assertEqual(len(calls), 1)
+
+	def test_not_published_when_punch_landed_during_build(self):
+		with patch.object(punch_log_cache, "get_version", return_value=8):
+			payload, hit = punch_log_cache.get_cached("WO-1", 7, lambda: LOGS)
+		self.assertFalse(hit)
+		self.assertEqual(json.loads(payload), {"0": LOGS[0]})
+		self.assertEqual(len(punch_log_cache._cache), 0)
+
+	def test_builder_error_is_not_cached(self):
+		def failing():
+			raise RuntimeError("db gone")
+
+		with patch.object(punch_log_cache, "get_version", return_value=7):
+			with self.assertRaises(RuntimeError):
+				punch_log_cache.get_cached("WO-1", 7, failing)
+		self.assertEqual(len(punch_log_cache._cache), 0)
+
+	def test_version_check_failure_is_not_published(self):
+		with patch.object(punch_log_cache, "get_version", side_effect=ConnectionError("redis gone")):
+			payload, hit = punch_log_cache.get_cached("WO-1", 7, lambda: LOGS)
+		self.assertFalse(hit)
+		self.assertEqual(json.loads(payload), {"0": LOGS[0]})
+		self.assertEqual(len(punch_log_cache._cache), 0)
+
+	def test_variants_are_cached_apart(self):
+		with patch.object(punch_log_cache, "get_version", return_value=7):
+			punch_log_cache.get_cached("WO-1", 7, lambda: {"v": "compact"})
+			payload, hit = punch_log_cache.get_cached("WO-1", 7, lambda: {"v": "detail"}, variant="detail")
+		self.assertFalse(hit)
+		self.assertEqual(json.loads(payload), {"v": "detail"})
+
+
+class TestGetPunchLogsResponse(ntsTestCase):
+	def setUp(self):
+		punch_log_cache._cache.clear()
+		patcher = patch.object(punch_log_cache, "get_version", return_value=3)
+		self.get_version = patcher.start()
+		self.addCleanup(patcher.stop)
+		patcher = patch.object(work_order_ops, "_build_punch_logs", return_value=LOGS)
+		self.build = patcher.start()
+		self.addCleanup(patcher.stop)
+
+	def test_without_known_version_returns_plain_map(self):
+		self.assertEqual(work_order_ops.get_punch_logs("WO-1"), {"0": LOGS[0]})
+
+	def test_known_version_mismatch_returns_envelope(self):
+		resp = work_order_ops.get_punch_logs("WO-1", known_version="")
+		self.assertEqual(resp, {"version": 3, "not_modified": False, "logs": {"0": LOGS[0]}})
+
+	def test_known_version_match_skips_payload(self):
+		resp = work_order_ops.get_punch_logs("WO-1", known_version="3")
+		self.assertEqual(resp, {"version": 3, "not_modified": True})
+		self.build.assert_not_called()
+
+	def test_failed_read_is_unversioned(self):
+		self.build.side_effect = RuntimeError("db gone")
+		resp = work_order_ops.get_punch_logs("WO-1", known_version="")
+		self.assertEqual(resp, {"version": None, "not_modified": False, "logs": {}})
+		self.assertEqual(work_order_ops.get_punch_logs("WO-1"), {})
+
+	def test_redis_down_serves_uncached_logs(self):
+		self.get_version.side_effect = ConnectionError("redis gone")
+		self.assertEqual(work_order_ops.get_punch_logs("WO-1"), LOGS)
+		resp = work_order_ops.get_punch_logs("WO-1", known_version="3")
+		self.assertEqual(resp, {"version": None, "not_modified": False, "logs": LOGS})
+		self.assertEqual(len(punch_log_cache._cache), 0)
+
+
+class TestPunchLogDocEvents(ntsTestCase):
+	def test_change_bumps_version_after_commit(self):
+		callbacks = []
+		with (
+			patch.object(punch_log_cache.nts.db, "after_commit", create=True) as after_commit,
+			patch.object(punch_log_cache, "bump_version") as bump,
+		):
+			after_commit.add.side_effect = callbacks.append
+			punch_log_cache.on_punch_log_change(nts._dict(parent_work_order="WO-1"), "on_trash")
+			bump.assert_not_called()
+			for callback in callbacks:
+				callback()
+		bump.assert_called_once_with("WO-1")
@@ -0,0 +1,160 @@
+# Copyright (c) 2025, NTS and Contributors
+# See license.txt
+
+import re
+from collections import Counter
+from unittest.mock import patch
+
+import nts
+from nts.tests.utils import ntsTestCase
+
+from reporting.reporting.api import work_order_ops
+from reporting.reporting.api.work_order_ops import _stage_punch_writes
+from reporting.reporting.unit_of_work import UnitOfWork
+
+TABLE_COLUMNS = {
+	"tabOperation Punch Log": {
+		"name",
+		"parent_work_order",
+		"parent_op_idx",
+		"parent_op_name",
+		"employee_number",
+		"employee_name",
+		"produced_qty",
+		"rejected_qty",
+		"posting_datetime",
+		"processed",
+		"rejection_reason",
+		"client_punch_id",
+		"creation",
+		"modified",
+	},
+	"tabJob Card": {"name", "total_completed_qty", "status", "docstatus"},
+	"tabJob Card Time Log": {"name", "completed_qty", "rejected_qty"},
+	"tabWork Order Operation": {
+		"name",
+		"completed_qty",
+		"process_loss_qty",
+		"op_reported",
+		"op_reported_by_employee_name",
+		"op_reported_dt",
+	},
+}
+
+
+class _Doc(nts._dict):
+	def insert(self, **kwargs):
+		self.name = "JCTL-0001"
+
+
+def _get_doc(*args, **kwargs):
+	if isinstance(args[0], dict):
+		return _Doc(args[0])
+	if args[0] == "Work Order":
+		operation = nts._dict(name="WOOP-0001", idx=1, operation="Cut", workstation="WS-1")
+		return nts._dict(name=args[1], docstatus=1, qty=10, operations=[operation])
+	return nts._dict(name=args[1])
+
+
+def _get_value(doctype, filters, fields, as_dict=False):
+	if doctype == "Employee":
+		return {"name": "EMP-0001", "employee_name": "Jane", "employee_number": "E-1"}
+	return {"completed_qty": 0, "process_loss_qty": 0}
+
+
+def _sql(query, values=None, as_dict=False):
+	if "FROM `tabJob Card` WHERE work_order" in query:
+		return [("JC-0001", 0)]
+	if "FROM `tabJob Card Time Log`" in query:
+		return [{"total_completed": 8}]
+	if "AS prod_sum" in query:
+		return [{"prod_sum": 0, "rej_sum": 0}]
+	return []
+
+
+def _report(stats_error=None, **kwargs):
+	"""Run report_operation against a faked database; returns (result, executed statements, events)."""
+	events = []
+
+	def record_punch(*args):
+		events.append("record_punch")
+		if stats_error:
+			raise stats_error
+
+	with (
+		patch.object(nts.db, "sql", side_effect=_sql) as sql,
+		patch.object(nts.db, "get_value", side_effect=_get_value),
+		patch.object(nts.db, "commit", side_effect=lambda: events.append("commit")),
+		patch.object(nts.db, "rollback", side_effect=lambda: events.append("rollback")),
+		patch.object(nts, "get_doc", side_effect=_get_doc),
+		patch.object(work_order_ops, "_table_exists", return_value=True),
+		patch.object(work_order_ops, "_get_table_columns", side_effect=lambda t: TABLE_COLUMNS.get(t, set())),
+		patch.object(work_order_ops, "log_error"),
+		patch.object(work_order_ops.cycle_stats, "record_punch", side_effect=record_punch),
+		patch.object(work_order_ops.punch_log_cache, "bump_version"),
+	):
+		result = work_order_ops.report_operation("WO-0001", 0, "Cut", "E-1", **kwargs)
+	statements = [(c.args[0], c.args[1] if len(c.args) > 1 else ()) for c in sql.call_args_list]
+	return result, statements, events
+
+
+def _updates_per_table(statements):
+	return Counter(re.match(r"UPDATE `([^`]+)`", q).group(1) for q, _ in statements if q.startswith("UPDATE"))
+
+
+def _punch_log_insert(statements):
+	((query, values),) = [
+		(q, v) for q, v in statements if q.startswith("INSERT INTO `tabOperation Punch Log`")
+	]
+	# creation/modified are NOW() and carry no value
+	columns = re.findall(r"`([^`]+)`", query.split("VALUES")[0])[1:]
+	columns = [c for c in columns if c not in ("creation", "modified")]
+	return dict(zip(columns, values, strict=True))
+
+
+class TestUnitOfWork(ntsTestCase):
+	def test_completing_punch_writes_each_row_once(self):
+		result, statements, _events = _report(produced_qty=8, process_loss=2, rejection_reason="Scratch")
+
+		self.assertTrue(result["operation_completed"])
+		# Previously: totals, op_reported, reporter info, job card total, job card status
+		# and the punch log's processed flag were six separate UPDATEs.
+		self.assertEqual(_updates_per_table(statements), {"tabWork Order Operation": 1, "tabJob Card": 1})
+		punch = _punch_log_insert(statements)
+		self.assertEqual(punch["processed"], 1)
+		self.assertEqual((punch["produced_qty"], punch["rejected_qty"]), (8, 2))
+
+	def test_partial_punch_writes_each_row_once(self):
+		result, statements, _events = _report(produced_qty=3)
+
+		self.assertFalse(result["operation_completed"])
+		self.assertEqual(_updates_per_table(statements), {"tabWork Order Operation": 1, "tabJob Card": 1})
+		self.assertEqual(_punch_log_insert(statements)["processed"], 1)
+
+	def test_cycle_stats_update_after_the_punch_commits(self):
+		_result, _statements, events = _report(produced_qty=3)
+		# time log commit, punch commit, then the stats in their own transaction
+		self.assertEqual(events, ["commit", "commit", "record_punch", "commit"])
+
+	def test_cycle_stats_failure_keeps_the_punch(self):
+		result, statements, events = _report(stats_error=RuntimeError("stats gone"), produced_qty=3)
+		self.assertTrue(result["ok"])
+		self.assertEqual(events, ["commit", "commit", "record_punch", "rollback"])
+		self.assertEqual(_punch_log_insert(statements)["processed"], 1)
+
+	def test_staged_partial_punch_only_touches_operation_totals(self):
+		uow = _stage_punch_writes(UnitOfWork(), {}, "WO-0001", 1, "JC-0001", 5, 0)
+		query, values = uow.statements()[0]
+		self.assertEqual(len(uow.statements()), 1)
+		self.assertIn("COALESCE(`completed_qty`,0)+%s", query)
+		self.assertIn("WHERE `idx`=%s AND `parent`=%s", query)
+		self.assertEqual(values, (5, 0, 2, "WO-0001"))
+
+	def test_set_after_increment_wins(self):
+		uow = UnitOfWork()
+		uow.increment("tabJob Card", {"name": "JC-0001"}, total_completed_qty=3)
+		uow.set("tabJob Card", {"name": "JC-0001"}, total_completed_qty=10)
+		uow.increment("tabJob Card", {"name": "JC-0001"}, total_completed_qty=1)
+		((query, values),) = uow.statements()
+		self.assertEqual(query, "UPDATE `tabJob Card` SET `total_completed_qty`=%s WHERE `name`=%s")
+		self.assertEqual(values, (11, "JC-0001"))
@@ -0,0 +1,77 @@
+# Copyright (c) 2025, NTS and contributors
+# For license information, please see license.txt
+
+"""Write coalescing for the punch path.
+
+Instead of issuing an UPDATE per concern, callers stage column changes on a
+:class:`UnitOfWork` and :meth:`UnitOfWork.flush` writes each touched row once.
+"""
+
+from collections import OrderedDict
+
+import nts
+
+
+class UnitOfWork:
+	"""Collects pending column changes per row and flushes one UPDATE per row.
+
+	Rows are identified by table and a ``where`` mapping, e.g. ``{"name": ...}`` or
+	``{"parent": ..., "idx": ...}``. ``set`` assigns values, ``increment`` adds to the
+	stored value (NULL counts as 0); the last ``set`` of a column wins and a ``set``
+	replaces any pending increment of that column.
+	"""
+
+	def __init__(self):
+		self._rows = OrderedDict()
+
+	def _row(self, table, where):
+		key = (table, tuple(sorted(where.items())))
+		if key not in self._rows:
+			self._rows[key] = {"set": OrderedDict(), "inc": OrderedDict()}
+		return self._rows[key]
+
+	def set(self, table, where, **values):
+		row = self._row(table, where)
+		for column, value in values.items():
+			row["inc"].pop(column, None)
+			row["set"][column] = value
+
+	def increment(self, table, where, **deltas):
+		row = self._row(table, where)
+		for column, delta in deltas.items():
+			if column in row["set"]:
+				row["set"][column] = (row["set"][column] or 0) + delta
+			else:
+				row["inc"][column] = row["inc"].get(column, 0) + delta
+
+	def statements(self):
+		"""Return the ``(query, values)`` pairs :meth:`flush` would execute."""
+		out = []
+		for (table, where), row in self._rows.items():
+			assignments, values = [], []
+			for column, value in row["set"].items():
+				assignments.append(f"`{column}`=%s")
+				values.append(value)
+			for column, delta in row["inc"].items():
+				assignments.append(f"`{column}`=COALESCE(`{column}`,0)+%s")
+				values.append(delta)
+			if not assignments:
+				continue
+			conditions = " AND ".join(f"`{column}`=%s" for column, _ in where)
+			values.extend(value for _, value in where)
+			out.append((f"UPDATE `{table}` SET {', '.join(assignments)} WHERE {conditions}", tuple(values)))
+		return out
+
+	def flush(self):
+		"""Execute the pending UPDATEs (without committing) and reset; returns the statement count."""
+		statements = self.statements()
+		for query, values in statements:
+			nts.db.sql(query, values)
+		self.discard()
+		return len(statements)
+
+	def discard(self):
+		self._rows.clear()
+
+	def __len__(self):
+		return len(self._rows)